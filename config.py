@@ -3,121 +3,104 @@ Configuration file for Telegram Music Bot
 """
 
 import os
-from typing import List
+import re
+from typing import FrozenSet
 
-class Config:
+# Snapshot the environment once; every lookup below reads from this dict
+_ENV = dict(os.environ)
+
+# Numeric user IDs inside the comma separated SUDO_USERS value
+_SUDO_ID_RE = re.compile(r'\d+')
+
+def _get(key: str, default: str = "") -> str:
+    """Read a value from the environment snapshot"""
+    return _ENV.get(key, default)
+
+def _load_sudo_users() -> FrozenSet[int]:
+    """Parse SUDO_USERS from the environment and add the owner"""
+    sudo_users = {int(match.group()) for match in _SUDO_ID_RE.finditer(_get("SUDO_USERS", ""))}
+    
+    # Add owner to sudo users
+    if Config.OWNER_ID:
+        sudo_users.add(Config.OWNER_ID)
+    
+    # Frozen for O(1) membership checks in admin guards
+    return frozenset(sudo_users)
+
+# Set once ensure_paths() has created the working directories
+_dirs_ready = False
+
+# Attributes computed on first access instead of at import
+_LAZY_ATTRS = {
+    "SUDO_USERS": _load_sudo_users,
+}
+
+class _LazyConfig(type):
+    """Metaclass that resolves lazy attributes once and caches them on the class"""
+    def __getattr__(cls, name):
+        loader = _LAZY_ATTRS.get(name)
+        if loader is None:
+            raise AttributeError(f"Config has no attribute '{name}'")
+        value = loader()
+        setattr(cls, name, value)
+        return value
+
+class Config(metaclass=_LazyConfig):
     # Bot credentials
-    BOT_TOKEN = os.getenv("BOT_TOKEN", "")
-    API_ID = int(os.getenv("API_ID", "0"))
-    API_HASH = os.getenv("API_HASH", "")
+    BOT_TOKEN = _get("BOT_TOKEN", "")
+    API_ID = int(_get("API_ID", "0") or "0")
+    API_HASH = _get("API_HASH", "")
 
     # User session string (for voice chat functionality)
     # Generate this using the generate_session.py script
-    USER_SESSION_STRING = os.getenv("USER_SESSION_STRING", "")
+    USER_SESSION_STRING = _get("USER_SESSION_STRING", "")
     
     # Database
-    DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///musicbot.db")
+    DATABASE_URL = _get("DATABASE_URL", "sqlite:///musicbot.db")
     
     # Audio settings
-    BITRATE = int(os.getenv("BITRATE", "512"))
-    FPS = int(os.getenv("FPS", "20"))
+    BITRATE = int(_get("BITRATE", "512") or "512")
+    FPS = int(_get("FPS", "20") or "20")
     
     # Bot settings
-    OWNER_ID = int(os.getenv("OWNER_ID", "0"))
-    SUDO_USERS: List[int] = []
-    
-    # Load sudo users from environment
-    sudo_users_str = os.getenv("SUDO_USERS", "")
-    if sudo_users_str:
-        SUDO_USERS = [int(x.strip()) for x in sudo_users_str.split(",") if x.strip().isdigit()]
-    
-    # Add owner to sudo users
-    if OWNER_ID and OWNER_ID not in SUDO_USERS:
-        SUDO_USERS.append(OWNER_ID)
+    OWNER_ID = int(_get("OWNER_ID", "0") or "0")
+    SUDO_USERS: FrozenSet[int]  # parsed on first access, see _load_sudo_users
+    LOG_CHANNEL_ID = _get("LOG_CHANNEL_ID", "")  # Numeric ID or @username, empty disables channel logging
+    MAINTENANCE_MODE = _get("MAINTENANCE_MODE", "false").lower() == "true"
     
     # Music settings
-    MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", "50"))
-    MAX_SONG_DURATION = int(os.getenv("MAX_SONG_DURATION", "1800"))  # 30 minutes
-    DEFAULT_VOLUME = int(os.getenv("DEFAULT_VOLUME", "100"))
+    MAX_QUEUE_SIZE = int(_get("MAX_QUEUE_SIZE", "50") or "50")
+    MAX_SONG_DURATION = int(_get("MAX_SONG_DURATION", "1800") or "1800")  # 30 minutes
+    DEFAULT_VOLUME = int(_get("DEFAULT_VOLUME", "100") or "100")
     
     # YouTube settings
-    YOUTUBE_COOKIES_PATH = os.getenv("YOUTUBE_COOKIES_PATH", "")
+    YOUTUBE_COOKIES_PATH = _get("YOUTUBE_COOKIES_PATH", "")
+    YTDLP_CACHE_PATH = _get("YTDLP_CACHE_PATH", "./.cache/yt-dlp")  # Player JS decipher cache
     
     # File paths
-    DOWNLOADS_PATH = os.getenv("DOWNLOADS_PATH", "./downloads")
-    LOGS_PATH = os.getenv("LOGS_PATH", "./logs")
-    
-    # Create directories if they don't exist
-    os.makedirs(DOWNLOADS_PATH, exist_ok=True)
-    os.makedirs(LOGS_PATH, exist_ok=True)
+    DOWNLOADS_PATH = _get("DOWNLOADS_PATH", "./downloads")
+    MAX_DOWNLOADS_SIZE_MB = int(_get("MAX_DOWNLOADS_SIZE_MB", "5120") or "5120")
+    LOGS_PATH = _get("LOGS_PATH", "./logs")
     
     # Rate limiting
-    RATE_LIMIT_REQUESTS = int(os.getenv("RATE_LIMIT_REQUESTS", "10"))
-    RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))  # seconds
+    RATE_LIMIT_REQUESTS = int(_get("RATE_LIMIT_REQUESTS", "10") or "10")
+    RATE_LIMIT_WINDOW = int(_get("RATE_LIMIT_WINDOW", "60") or "60")  # seconds
     
     # Features
-    ENABLE_LYRICS = os.getenv("ENABLE_LYRICS", "true").lower() == "true"
-    ENABLE_SPOTIFY = os.getenv("ENABLE_SPOTIFY", "false").lower() == "true"
-    ENABLE_DEEZER = os.getenv("ENABLE_DEEZER", "false").lower() == "true"
+    ENABLE_LYRICS = _get("ENABLE_LYRICS", "true").lower() == "true"
+    ENABLE_SPOTIFY = _get("ENABLE_SPOTIFY", "false").lower() == "true"
+    ENABLE_DEEZER = _get("ENABLE_DEEZER", "false").lower() == "true"
     
     # Spotify credentials (if enabled)
-    SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID", "")
-    SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET", "")
-    
-    # Messages
-    START_MESSAGE = """
-🎵 **Welcome to Advanced Music Bot!**
-
-I can play music in your voice chats with many advanced features:
-
-**Basic Commands:**
-• /play [song name/url] - Play music
-• /pause - Pause current song
-• /resume - Resume playback
-• /skip - Skip current song
-• /stop - Stop playback and clear queue
-• /queue - Show current queue
-• /np - Show now playing
-
-**Advanced Features:**
-• /shuffle - Shuffle queue
-• /loop [off/song/queue] - Loop mode
-• /volume [1-200] - Adjust volume
-• /lyrics - Get song lyrics
-
-Type /help for more commands!
-"""
+    SPOTIFY_CLIENT_ID = _get("SPOTIFY_CLIENT_ID", "")
+    SPOTIFY_CLIENT_SECRET = _get("SPOTIFY_CLIENT_SECRET", "")
     
-    HELP_MESSAGE = """
-🎵 **Music Bot Commands**
-
-**Music Control:**
-• `/play` or `/p` - Play song from YouTube/Spotify/URL
-• `/pause` - Pause current song
-• `/resume` - Resume playback
-• `/skip` - Skip to next song
-• `/stop` - Stop music and clear queue
-
-**Queue Management:**
-• `/queue` or `/q` - Show current queue
-• `/shuffle` - Shuffle current queue
-• `/loop` [off/song/queue] - Set loop mode
-
-**Information:**
-• `/np` - Show currently playing song
-• `/lyrics` - Get lyrics for current song
-• `/volume` [1-200] - Adjust playback volume
-
-**Admin Commands:**
-• `/stats` - Show bot statistics
-• `/ban` [user_id] - Ban user from bot
-• `/unban` [user_id] - Unban user
-• `/broadcast` [message] - Send message to all users
-
-**Supported Sources:**
-• YouTube (links and search)
-• Spotify (if enabled)
-• Direct audio file URLs
-
-Join a voice chat and start playing music! 🎶
-"""
\ No newline at end of file
+    @classmethod
+    def ensure_paths(cls):
+        """Create working directories if they don't exist (runs once per process)"""
+        global _dirs_ready
+        if _dirs_ready:
+            return
+        os.makedirs(cls.DOWNLOADS_PATH, exist_ok=True)
+        os.makedirs(cls.LOGS_PATH, exist_ok=True)
+        _dirs_ready = True
@@ -8,6 +8,7 @@ import asyncio
 import sys
 import os
 from pyrogram import Client
+from config import _get
 
 async def main():
     print("=" * 60)
@@ -21,8 +22,8 @@ async def main():
     
     # Load from environment variables (Railway sets these)
     try:
-        API_ID = int(os.getenv("API_ID", "0"))
-        API_HASH = os.getenv("API_HASH", "")
+        API_ID = int(_get("API_ID", "0") or "0")
+        API_HASH = _get("API_HASH", "")
         
         if not API_ID or not API_HASH:
             print("❌ ERROR: API_ID and API_HASH environment variables not set!")
@@ -70,6 +71,14 @@ async def main():
             print()
             print(f"USER_SESSION_STRING={session_string}")
             print()
+            
+            # Optionally save it to a file (e.g. on a Railway volume)
+            session_out_path = _get("SESSION_OUT_PATH")
+            if session_out_path:
+                with open(session_out_path, 'w') as f:
+                    f.write(f"USER_SESSION_STRING={session_string}\n")
+                print(f"💾 Also saved to {session_out_path}")
+                print()
             print("=" * 60)
             print("📝 NEXT STEPS FOR RAILWAY:")
             print("1. Copy the USER_SESSION_STRING line above")
@@ -109,14 +118,16 @@ if __name__ == "__main__":
     finally:
         # Clean up session file
         try:
-            if os.path.exists("/tmp/music_bot_session.session"):
-                os.remove("/tmp/music_bot_session.session")
-                print("🧹 Cleaned up temporary session file")
-        except:
+            os.remove("/tmp/music_bot_session.session")
+            print("🧹 Cleaned up temporary session file")
+        except FileNotFoundError:
             pass
+        except OSError as e:
+            print(f"⚠️  Could not remove temporary session file: {e}")
         
-        # Keep the Railway deployment running so you can see the output
-        print("\n⏳ Keeping process alive for 5 minutes so you can copy the session string...")
-        print("   Copy the USER_SESSION_STRING line and add it to Railway variables")
-        import time
-        time.sleep(300)  # 5 minutes
\ No newline at end of file
+        # Only keep the deployment running when explicitly asked to
+        if _get("KEEP_ALIVE") == "1":
+            import signal
+            print("\n⏳ KEEP_ALIVE=1 set, waiting until stopped so you can copy the session string...")
+            print("   Copy the USER_SESSION_STRING line and add it to Railway variables")
+            signal.pause()
\ No newline at end of file
@@ -2,69 +2,130 @@
 Admin Handler - Handles admin-only commands
 """
 
+import asyncio
 import logging
-from typing import List
+import sqlite3
+from collections import deque
+from typing import List, Optional
+import aiofiles
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from telegram.constants import ChatAction
 from config import Config
 from utils.database import Database
+from utils.youtube_downloader import YouTubeDownloader
 from utils.decorators import admin_only
+from utils.tasks import spawn
 
 import os
+import platform
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
 logger = logging.getLogger(__name__)
 
+# Broadcast fan-out settings: each send holds its slot for at least
+# BROADCAST_DELAY seconds, capping throughput at ~25 messages/second
+BROADCAST_CONCURRENCY = 25
+BROADCAST_DELAY = 1.0
+BROADCAST_CHUNK_SIZE = 1000
+
+# Log tail settings
+LOG_TAIL_LINES = 100
+LOG_TAIL_SEEK_THRESHOLD = 10 * 1024 * 1024  # seek near the end above 10 MB
+LOG_TAIL_BYTES = 1024 * 1024
+
+def _read_log_tail(path: str, max_lines: int = LOG_TAIL_LINES) -> str:
+    """Return the last lines of a log file without loading all of it"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size > LOG_TAIL_SEEK_THRESHOLD:
+            f.seek(-LOG_TAIL_BYTES, os.SEEK_END)
+            f.readline()  # Skip the partial line we landed in
+        last_lines = deque(f, maxlen=max_lines)
+    return b''.join(last_lines).decode('utf-8', errors='replace')
+
+def _send_typing(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
+    """Show the typing indicator without waiting for the round-trip"""
+    spawn(context.bot.send_chat_action(chat_id, ChatAction.TYPING))
+
+def _backup_database(src_path: str, dst_path: str):
+    """Copy a live SQLite database using its online backup API"""
+    src = sqlite3.connect(src_path)
+    dst = sqlite3.connect(dst_path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+STATS_HEADER_TEMPLATE = """📊 **Bot Statistics**
+
+👥 **Users:** {total_users}
+💬 **Active Chats:** {total_chats}
+🎵 **Total Songs Played:** {total_songs_played}
+🚀 **Bot Started:** {bot_start_time}
+
+🏆 **Top Users:**
+"""
+
 class AdminHandler:
-    def __init__(self, db: Database):
+    # The stats keyboard never changes, build it once
+    STATS_MARKUP = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🔄 Refresh", callback_data="refresh_stats"),
+         InlineKeyboardButton("📈 Detailed Stats", callback_data="detailed_stats")]
+    ])
+    
+    def __init__(self, db: Database, youtube_dl: Optional[YouTubeDownloader] = None):
         self.db = db
+        # Shared with the music handler so cleanup and the download caches see the same files
+        self.youtube_dl = youtube_dl or YouTubeDownloader()
+        
+        # Cached for system_info
+        self._proc = None
+        self._boot_time = None
+        
+        # Create backups directory once instead of on every backup
+        os.makedirs('./backups', exist_ok=True)
         
     @admin_only
     async def stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show bot statistics"""
-        await context.bot.send_chat_action(update.effective_chat.id, ChatAction.TYPING)
-        
-        # Get bot stats
-        bot_stats = await self.db.get_bot_stats()
+        # Run the independent queries together, overlapped with the typing action
+        _, bot_stats, top_users, top_chats, popular_songs = await asyncio.gather(
+            context.bot.send_chat_action(update.effective_chat.id, ChatAction.TYPING),
+            self.db.get_bot_stats(),
+            self.db.get_top_users(5),
+            self.db.get_top_chats(5),
+            self.db.get_popular_songs(5)
+        )
         
-        # Get top users and chats
-        top_users = await self.db.get_top_users(5)
-        top_chats = await self.db.get_top_chats(5)
-        popular_songs = await self.db.get_popular_songs(5)
-        
-        message = f"""📊 **Bot Statistics**
-
-👥 **Users:** {bot_stats['total_users']}
-💬 **Active Chats:** {bot_stats['total_chats']}
-🎵 **Total Songs Played:** {bot_stats['total_songs_played']}
-🚀 **Bot Started:** {bot_stats['bot_start_time'][:19] if bot_stats['bot_start_time'] else 'Unknown'}
-
-🏆 **Top Users:**
-"""
+        parts = [STATS_HEADER_TEMPLATE.format(
+            total_users=bot_stats['total_users'],
+            total_chats=bot_stats['total_chats'],
+            total_songs_played=bot_stats['total_songs_played'],
+            bot_start_time=bot_stats['bot_start_time'][:19] if bot_stats['bot_start_time'] else 'Unknown'
+        )]
         
         for i, user in enumerate(top_users, 1):
             name = user['first_name'] or user['username'] or f"User {user['user_id']}"
-            message += f"{i}. {name} - {user['total_songs_played']} songs\n"
+            parts.append(f"{i}. {name} - {user['total_songs_played']} songs\n")
             
-        message += "\n🏆 **Top Chats:**\n"
+        parts.append("\n🏆 **Top Chats:**\n")
         for i, chat in enumerate(top_chats, 1):
             chat_name = chat['chat_title'] or f"Chat {chat['chat_id']}"
-            message += f"{i}. {chat_name} - {chat['total_songs_played']} songs\n"
+            parts.append(f"{i}. {chat_name} - {chat['total_songs_played']} songs\n")
             
-        message += "\n🎵 **Popular Songs:**\n"
+        parts.append("\n🎵 **Popular Songs:**\n")
         for i, song in enumerate(popular_songs, 1):
             title = song['title'][:30] + "..." if len(song['title']) > 30 else song['title']
-            message += f"{i}. {title} - {song['play_count']} plays\n"
+            parts.append(f"{i}. {title} - {song['play_count']} plays\n")
             
-        keyboard = [
-            [InlineKeyboardButton("🔄 Refresh", callback_data="refresh_stats"),
-             InlineKeyboardButton("📈 Detailed Stats", callback_data="detailed_stats")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await update.message.reply_text(
-            message,
-            reply_markup=reply_markup,
+            "".join(parts),
+            reply_markup=self.STATS_MARKUP,
             parse_mode='Markdown'
         )
         
@@ -96,7 +157,7 @@ class AdminHandler:
         except ValueError:
             await update.message.reply_text("❌ Invalid user ID!")
         except Exception as e:
-            logger.error(f"Error banning user: {e}")
+            logger.error("Error banning user: %s", e)
             await update.message.reply_text("❌ Error banning user!")
             
     @admin_only
@@ -121,7 +182,7 @@ class AdminHandler:
         except ValueError:
             await update.message.reply_text("❌ Invalid user ID!")
         except Exception as e:
-            logger.error(f"Error unbanning user: {e}")
+            logger.error("Error unbanning user: %s", e)
             await update.message.reply_text("❌ Error unbanning user!")
             
     @admin_only
@@ -157,27 +218,39 @@ class AdminHandler:
     async def execute_broadcast(self, context: ContextTypes.DEFAULT_TYPE, message: str, chat_id: int):
         """Execute the broadcast"""
         try:
-            user_ids = await self.db.get_all_users()
+            total_users = await self.db.count_broadcast_users()
             successful = 0
             failed = 0
             
             await context.bot.send_message(
                 chat_id,
-                f"📢 **Broadcasting to {len(user_ids)} users...**",
+                f"📢 **Broadcasting to {total_users} users...**",
                 parse_mode='Markdown'
             )
             
-            for user_id in user_ids:
-                try:
-                    await context.bot.send_message(
-                        user_id,
-                        f"📢 **Broadcast from Bot Admin:**\n\n{message}",
-                        parse_mode='Markdown'
-                    )
-                    successful += 1
-                except Exception as e:
-                    failed += 1
-                    logger.warning(f"Failed to send broadcast to {user_id}: {e}")
+            # Built once and shared by every send
+            text = f"📢 **Broadcast from Bot Admin:**\n\n{message}"
+            send_message = context.bot.send_message
+            semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+            
+            async def send(user_id: int) -> bool:
+                async with semaphore:
+                    try:
+                        await send_message(user_id, text, parse_mode='Markdown')
+                        return True
+                    except Exception as e:
+                        logger.warning("Failed to send broadcast to %s: %s", user_id, e)
+                        return False
+                    finally:
+                        # Stay under Telegram's ~30 messages/second limit
+                        await asyncio.sleep(BROADCAST_DELAY)
+            
+            # Send in chunks as they're read, so neither the IDs nor a coroutine per user are held at once
+            async for chunk in self.db.iter_all_users(BROADCAST_CHUNK_SIZE):
+                results = await asyncio.gather(*(send(user_id) for user_id in chunk))
+                sent = sum(results)
+                successful += sent
+                failed += len(results) - sent
                     
             # Send results
             await context.bot.send_message(
@@ -189,7 +262,7 @@ class AdminHandler:
             )
             
         except Exception as e:
-            logger.error(f"Error in broadcast: {e}")
+            logger.error("Error in broadcast: %s", e)
             await context.bot.send_message(
                 chat_id,
                 "❌ Error executing broadcast!",
@@ -199,16 +272,14 @@ class AdminHandler:
     @admin_only
     async def cleanup(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Clean up old files and database entries"""
-        await context.bot.send_chat_action(update.effective_chat.id, ChatAction.TYPING)
+        _send_typing(context, update.effective_chat.id)
         
         try:
             # Clean up old song history (older than 30 days)
             await self.db.cleanup_old_history(30)
             
             # Clean up old downloaded files
-            from utils.youtube_downloader import YouTubeDownloader
-            youtube_dl = YouTubeDownloader()
-            await youtube_dl.cleanup_old_files(24)  # 24 hours
+            await self.youtube_dl.cleanup_old_files(24)  # 24 hours
             
             await update.message.reply_text(
                 "✅ **Cleanup completed!**\n"
@@ -218,22 +289,33 @@ class AdminHandler:
             )
             
         except Exception as e:
-            logger.error(f"Error in cleanup: {e}")
+            logger.error("Error in cleanup: %s", e)
             await update.message.reply_text("❌ Error during cleanup!")
             
     @admin_only
     async def system_info(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show system information"""
+        if psutil is None:
+            await update.message.reply_text(
+                "❌ psutil not installed. Install with: `pip install psutil`",
+                parse_mode='Markdown'
+            )
+            return
+            
         try:
-            import psutil
-            import platform
-            from datetime import datetime, timedelta
+            from datetime import datetime
+            
+            # Process handle and boot time don't change, look them up once
+            if self._proc is None:
+                self._proc = psutil.Process()
+                self._boot_time = datetime.fromtimestamp(psutil.boot_time())
+            boot_time = self._boot_time
             
             # System info
             cpu_percent = psutil.cpu_percent(interval=1)
             memory = psutil.virtual_memory()
             disk = psutil.disk_usage('/')
-            boot_time = datetime.fromtimestamp(psutil.boot_time())
+            cpu_times = self._proc.cpu_times()
             
             message = f"""🖥️ **System Information**
 
@@ -246,50 +328,42 @@ class AdminHandler:
 **Uptime:** {str(datetime.now() - boot_time).split('.')[0]}
 
 **Bot Process:**
-**PID:** {psutil.Process().pid}
-**Memory Usage:** {psutil.Process().memory_info().rss // 1024 // 1024} MB
-**CPU Time:** {psutil.Process().cpu_times().user + psutil.Process().cpu_times().system:.2f}s
+**PID:** {self._proc.pid}
+**Memory Usage:** {self._proc.memory_info().rss // 1024 // 1024} MB
+**CPU Time:** {cpu_times.user + cpu_times.system:.2f}s
 """
             
             await update.message.reply_text(message, parse_mode='Markdown')
             
-        except ImportError:
-            await update.message.reply_text(
-                "❌ psutil not installed. Install with: `pip install psutil`",
-                parse_mode='Markdown'
-            )
         except Exception as e:
-            logger.error(f"Error getting system info: {e}")
+            logger.error("Error getting system info: %s", e)
             await update.message.reply_text("❌ Error getting system information!")
             
     @admin_only
     async def backup_db(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Create database backup"""
         try:
-            import shutil
             from datetime import datetime
             
             backup_name = f"musicbot_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
             backup_path = f"./backups/{backup_name}"
             
-            # Create backups directory
-            import os
-            os.makedirs('./backups', exist_ok=True)
-            
-            # Copy database
-            shutil.copy2('./musicbot.db', backup_path)
+            # Copy database page by page, off the event loop
+            await asyncio.to_thread(_backup_database, self.db.db_path, backup_path)
             
             # Send backup file
-            with open(backup_path, 'rb') as backup_file:
-                await context.bot.send_document(
-                    chat_id=update.effective_chat.id,
-                    document=backup_file,
-                    filename=backup_name,
-                    caption=f"📦 **Database Backup**\nCreated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                )
+            async with aiofiles.open(backup_path, 'rb') as backup_file:
+                backup_data = await backup_file.read()
+                
+            await context.bot.send_document(
+                chat_id=update.effective_chat.id,
+                document=backup_data,
+                filename=backup_name,
+                caption=f"📦 **Database Backup**\nCreated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+            )
                 
         except Exception as e:
-            logger.error(f"Error creating backup: {e}")
+            logger.error("Error creating backup: %s", e)
             await update.message.reply_text("❌ Error creating database backup!")
             
     @admin_only
@@ -313,31 +387,28 @@ class AdminHandler:
         """Get bot logs"""
         try:
             log_file = "bot.log"
-            if os.path.exists(log_file):
-                # Get last 100 lines
-                with open(log_file, 'r') as f:
-                    lines = f.readlines()
-                    last_lines = lines[-100:] if len(lines) > 100 else lines
-                    
-                log_content = ''.join(last_lines)
+            
+            # Get last 100 lines
+            try:
+                log_content = await asyncio.to_thread(_read_log_tail, log_file)
+            except FileNotFoundError:
+                await update.message.reply_text("❌ Log file not found!")
+                return
                 
-                # Send as file if too long
-                if len(log_content) > 4000:
-                    with open(log_file, 'rb') as f:
-                        await context.bot.send_document(
-                            chat_id=update.effective_chat.id,
-                            document=f,
-                            filename="bot_logs.txt",
-                            caption="📋 **Bot Logs** (Last 100 lines)"
-                        )
-                else:
-                    await update.message.reply_text(
-                        f"📋 **Bot Logs (Last 100 lines):**\n\n```\n{log_content}\n```",
-                        parse_mode='Markdown'
-                    )
+            # Send as file if too long (the tail we already read, not the whole log)
+            if len(log_content) > 4000:
+                await context.bot.send_document(
+                    chat_id=update.effective_chat.id,
+                    document=log_content.encode('utf-8'),
+                    filename="bot_logs.txt",
+                    caption="📋 **Bot Logs** (Last 100 lines)"
+                )
             else:
-                await update.message.reply_text("❌ Log file not found!")
+                await update.message.reply_text(
+                    f"📋 **Bot Logs (Last 100 lines):**\n\n```\n{log_content}\n```",
+                    parse_mode='Markdown'
+                )
                 
         except Exception as e:
-            logger.error(f"Error getting logs: {e}")
+            logger.error("Error getting logs: %s", e)
             await update.message.reply_text("❌ Error retrieving logs!")
\ No newline at end of file
@@ -2,103 +2,220 @@
 Callback Handler - Handles inline keyboard callbacks
 """
 
+import asyncio
 import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from functools import partial
+from itertools import islice
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+from telegram.error import BadRequest, RetryAfter
 from config import Config
+from messages import HELP_MESSAGE, LYRICS_TEMPLATE
 from utils.database import Database
 from utils.audio_manager import AudioManager
+from utils.youtube_downloader import YouTubeDownloader
+from handlers.admin_handler import AdminHandler
+from utils.tasks import spawn
+from utils.telegram_egress import TelegramEgress, SendMessage, EditMessage
 
 logger = logging.getLogger(__name__)
 
+# Max cached per-chat keyboards
+MARKUP_CACHE_SIZE = 1024
+
+# Callbacks run in the background because they wait on the network
+SLOW_ACTIONS = frozenset({"lyrics", "confirm_broadcast", "confirm_restart", "detailed_stats"})
+
+# Seconds a stats query result is reused across callbacks
+STATS_CACHE_TTL = 3
+
+# Loop mode cycle for the loop button: off -> song -> queue -> off
+NEXT_LOOP_MODE = {"off": "song", "song": "queue", "queue": "off"}
+LOOP_MODE_EMOJIS = {"off": "➡️", "song": "🔂", "queue": "🔁"}
+
+QUICK_STATS_TEMPLATE = """📊 **Quick Stats**
+
+👥 **Users:** {total_users}
+💬 **Active Chats:** {total_chats}
+🎵 **Songs Played:** {total_songs_played}
+"""
+
+DETAILED_STATS_TEMPLATE = """📊 **Detailed Statistics**
+
+📈 **Bot Stats:**
+👥 Users: {total_users}
+💬 Active Chats: {total_chats}
+🎵 Total Songs: {total_songs_played}
+🚀 Started: {bot_start_time}
+
+🏆 **Top Users:**
+"""
+
 class CallbackHandler:
-    def __init__(self, db: Database, audio_manager: AudioManager):
+    # Static keyboards, built once
+    STATS_MARKUP = InlineKeyboardMarkup([
+        [InlineKeyboardButton("📈 Detailed Stats", callback_data="detailed_stats"),
+         InlineKeyboardButton("🔄 Refresh", callback_data="refresh_stats")]
+    ])
+    BACK_TO_STATS_MARKUP = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🔙 Back", callback_data="stats")]
+    ])
+    
+    def __init__(self, db: Database, audio_manager: AudioManager, egress: TelegramEgress,
+                 admin_handler: Optional[AdminHandler] = None,
+                 youtube_dl: Optional[YouTubeDownloader] = None):
         self.db = db
         self.audio_manager = audio_manager
-        
+        self.egress = egress
+        self.youtube_dl = youtube_dl or YouTubeDownloader()
+        self.admin_handler = admin_handler or AdminHandler(db, self.youtube_dl)
+        
+        # Callback data -> handler, built once instead of an if/elif chain
+        self._exact_actions = {
+            "help": self._handle_help,
+            "stats": self._handle_stats,
+            "join_vc": self._handle_join_vc,
+            "refresh_stats": self._handle_refresh_stats,
+            "detailed_stats": self._handle_detailed_stats,
+            "confirm_broadcast": self._handle_confirm_broadcast,
+            "cancel_broadcast": self._handle_cancel_broadcast,
+            "confirm_restart": self._handle_confirm_restart,
+            "cancel_restart": self._handle_cancel_restart,
+        }
+        self._chat_actions = {
+            "pause": self._handle_pause,
+            "resume": self._handle_resume,
+            "skip": self._handle_skip,
+            "stop": self._handle_stop,
+            "shuffle": self._handle_shuffle,
+            "queue": self._handle_queue,
+            "clear_queue": self._handle_clear_queue,
+            "loop": self._handle_loop,
+            "lyrics": self._handle_lyrics,
+        }
+        
+        # (chat_id, paused) -> playback controls markup, least recently used first
+        self._markup_cache: "OrderedDict[Tuple[int, bool], InlineKeyboardMarkup]" = OrderedDict()
+        
+        # key -> (expiry, future) for stats queries, shared by concurrent presses
+        self._stats_cache: Dict[str, Tuple[float, asyncio.Future]] = {}
+        
+    def _playing_markup(self, chat_id: int, paused: bool) -> InlineKeyboardMarkup:
+        """Get the pause/resume controls for a chat, building them only once"""
+        key = (chat_id, paused)
+        markup = self._markup_cache.get(key)
+        if markup is not None:
+            self._markup_cache.move_to_end(key)
+            return markup
+            
+        if paused:
+            toggle = InlineKeyboardButton("▶️ Resume", callback_data=f"resume_{chat_id}")
+        else:
+            toggle = InlineKeyboardButton("⏸️ Pause", callback_data=f"pause_{chat_id}")
+        markup = InlineKeyboardMarkup([
+            [toggle,
+             InlineKeyboardButton("⏭️ Skip", callback_data=f"skip_{chat_id}")],
+            [InlineKeyboardButton("🔀 Shuffle", callback_data=f"shuffle_{chat_id}"),
+             InlineKeyboardButton("📋 Queue", callback_data=f"queue_{chat_id}")]
+        ])
+        
+        self._markup_cache[key] = markup
+        if len(self._markup_cache) > MARKUP_CACHE_SIZE:
+            self._markup_cache.popitem(last=False)
+        return markup
+        
+    async def _cached(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Return a recent result for key, or fetch it once for all concurrent callers"""
+        now = time.monotonic()
+        entry = self._stats_cache.get(key)
+        if entry and entry[0] > now:
+            return await asyncio.shield(entry[1])
+            
+        future = asyncio.ensure_future(fetch())
+        self._stats_cache[key] = (now + STATS_CACHE_TTL, future)
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            # Don't keep serving a failure
+            if self._stats_cache.get(key, (None, None))[1] is future:
+                del self._stats_cache[key]
+            raise
+            
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle all callback queries"""
         query = update.callback_query
         await query.answer()
         
         data = query.data
-        chat_id = update.effective_chat.id
-        user_id = update.effective_user.id
-        
-        try:
-            if data == "help":
-                await self._handle_help(query)
-            elif data == "stats":
-                await self._handle_stats(query)
-            elif data == "join_vc":
-                await self._handle_join_vc(query, context)
-            elif data.startswith("pause_"):
-                await self._handle_pause(query, context)
-            elif data.startswith("resume_"):
-                await self._handle_resume(query, context)
-            elif data.startswith("skip_"):
-                await self._handle_skip(query, context)
-            elif data.startswith("stop_"):
-                await self._handle_stop(query, context)
-            elif data.startswith("shuffle_"):
-                await self._handle_shuffle(query)
-            elif data.startswith("queue_"):
-                await self._handle_queue(query)
-            elif data.startswith("clear_queue_"):
-                await self._handle_clear_queue(query)
-            elif data.startswith("loop_"):
-                await self._handle_loop(query)
-            elif data.startswith("lyrics_"):
-                await self._handle_lyrics(query, context)
-            elif data == "refresh_stats":
-                await self._handle_refresh_stats(query)
-            elif data == "detailed_stats":
-                await self._handle_detailed_stats(query)
-            elif data == "confirm_broadcast":
-                await self._handle_confirm_broadcast(query, context)
-            elif data == "cancel_broadcast":
-                await self._handle_cancel_broadcast(query)
-            elif data == "confirm_restart":
-                await self._handle_confirm_restart(query, context)
-            elif data == "cancel_restart":
-                await self._handle_cancel_restart(query)
+        args = ()
+        
+        handler = self._exact_actions.get(data)
+        action = data
+        if handler is None:
+            # Per-chat actions look like "<action>_<chat_id>"
+            action, _, chat_id = data.rpartition("_")
+            handler = self._chat_actions.get(action)
+            if handler and chat_id.lstrip("-").isdigit():
+                args = (int(chat_id),)
             else:
-                await query.edit_message_text("❌ Unknown callback data!")
+                handler = self._handle_unknown
                 
+        if action in SLOW_ACTIONS:
+            # Network-bound work shouldn't hold up other callbacks
+            spawn(self._run_action(handler, query, context, *args))
+        else:
+            await self._run_action(handler, query, context, *args)
+            
+    async def _run_action(self, handler, query, context, *args):
+        """Run a callback sub-handler and report failures to the user"""
+        try:
+            await handler(query, context, *args)
+        except BadRequest as e:
+            # Pressing the same button twice is harmless
+            if "message is not modified" in str(e).lower():
+                return
+            logger.error(f"Error handling callback {query.data}: {e}")
+            spawn(self._safe_notify(query, "❌ An error occurred!"))
+        except RetryAfter as e:
+            # Flood control: another API call now would only be rejected again
+            logger.warning(f"Flood control on callback {query.data}, retry after {e.retry_after}s")
+            await asyncio.sleep(e.retry_after)
+            # Not retried since the action may already have taken effect (e.g. loop mode cycled)
+            spawn(self._safe_notify(query, "⚠️ Too many requests right now, please try again."))
         except Exception as e:
-            logger.error(f"Error handling callback {data}: {e}")
-            try:
-                await query.edit_message_text("❌ An error occurred!")
-            except:
-                pass
-                
-    async def _handle_help(self, query):
+            logger.exception(f"Error handling callback {query.data}: {e}")
+            spawn(self._safe_notify(query, "❌ An error occurred!"))
+            
+    async def _safe_notify(self, query, text: str):
+        """Best-effort edit of the callback message"""
+        try:
+            await query.edit_message_text(text)
+        except Exception as e:
+            logger.debug(f"Could not notify callback user: {e}")
+            
+    async def _handle_unknown(self, query, context):
+        """Handle unrecognised callback data"""
+        await query.edit_message_text("❌ Unknown callback data!")
+        
+    async def _handle_help(self, query, context):
         """Handle help callback"""
         await query.edit_message_text(
-            Config.HELP_MESSAGE,
+            HELP_MESSAGE,
             parse_mode='Markdown'
         )
         
-    async def _handle_stats(self, query):
+    async def _handle_stats(self, query, context):
         """Handle stats callback"""
-        bot_stats = await self.db.get_bot_stats()
-        
-        message = f"""📊 **Quick Stats**
-
-👥 **Users:** {bot_stats['total_users']}
-💬 **Active Chats:** {bot_stats['total_chats']}
-🎵 **Songs Played:** {bot_stats['total_songs_played']}
-"""
-        
-        keyboard = [
-            [InlineKeyboardButton("📈 Detailed Stats", callback_data="detailed_stats"),
-             InlineKeyboardButton("🔄 Refresh", callback_data="refresh_stats")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        bot_stats = await self._cached("bot_stats", self.db.get_bot_stats)
         
         await query.edit_message_text(
-            message,
-            reply_markup=reply_markup,
+            QUICK_STATS_TEMPLATE.format(**bot_stats),
+            reply_markup=self.STATS_MARKUP,
             parse_mode='Markdown'
         )
         
@@ -108,114 +225,95 @@ class CallbackHandler:
         
         try:
             if await self.audio_manager.is_in_voice_chat(chat_id):
-                await query.edit_message_text("✅ **Already connected to voice chat!**", parse_mode='Markdown')
+                await query.edit_message_text("✅ <b>Already connected to voice chat!</b>", parse_mode='HTML')
             else:
                 await self.audio_manager.join_voice_chat(chat_id)
-                await query.edit_message_text("✅ **Joined voice chat successfully!**", parse_mode='Markdown')
+                await query.edit_message_text("✅ <b>Joined voice chat successfully!</b>", parse_mode='HTML')
         except Exception as e:
             await query.edit_message_text(
                 f"❌ **Failed to join voice chat:**\n`{str(e)}`",
                 parse_mode='Markdown'
             )
             
-    async def _handle_pause(self, query, context):
+    async def _handle_pause(self, query, context, chat_id: int):
         """Handle pause callback"""
-        chat_id = int(query.data.split("_")[1])
-        
         if await self.audio_manager.pause(chat_id):
-            # Update button to resume
-            keyboard = [
-                [InlineKeyboardButton("▶️ Resume", callback_data=f"resume_{chat_id}"),
-                 InlineKeyboardButton("⏭️ Skip", callback_data=f"skip_{chat_id}")],
-                [InlineKeyboardButton("🔀 Shuffle", callback_data=f"shuffle_{chat_id}"),
-                 InlineKeyboardButton("📋 Queue", callback_data=f"queue_{chat_id}")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_reply_markup(reply_markup=reply_markup)
-            await context.bot.send_message(chat_id, "⏸️ **Playback paused**", parse_mode='Markdown')
+            # Only swap the button so the now-playing text stays intact
+            await self.egress.enqueue(EditMessage(
+                query.message.chat_id, query.message.message_id,
+                self._playing_markup(chat_id, paused=True)
+            ))
+            await self.egress.enqueue(SendMessage(chat_id, "⏸️ <b>Playback paused</b>", {'parse_mode': 'HTML'}))
         else:
-            await context.bot.send_message(chat_id, "❌ Nothing is playing!")
+            await self.egress.enqueue(SendMessage(chat_id, "❌ Nothing is playing!"))
             
-    async def _handle_resume(self, query, context):
+    async def _handle_resume(self, query, context, chat_id: int):
         """Handle resume callback"""
-        chat_id = int(query.data.split("_")[1])
-        
         if await self.audio_manager.resume(chat_id):
-            # Update button to pause
-            keyboard = [
-                [InlineKeyboardButton("⏸️ Pause", callback_data=f"pause_{chat_id}"),
-                 InlineKeyboardButton("⏭️ Skip", callback_data=f"skip_{chat_id}")],
-                [InlineKeyboardButton("🔀 Shuffle", callback_data=f"shuffle_{chat_id}"),
-                 InlineKeyboardButton("📋 Queue", callback_data=f"queue_{chat_id}")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_reply_markup(reply_markup=reply_markup)
-            await context.bot.send_message(chat_id, "▶️ **Playback resumed**", parse_mode='Markdown')
+            # Only swap the button so the now-playing text stays intact
+            await self.egress.enqueue(EditMessage(
+                query.message.chat_id, query.message.message_id,
+                self._playing_markup(chat_id, paused=False)
+            ))
+            await self.egress.enqueue(SendMessage(chat_id, "▶️ <b>Playback resumed</b>", {'parse_mode': 'HTML'}))
         else:
-            await context.bot.send_message(chat_id, "❌ Nothing is paused!")
+            await self.egress.enqueue(SendMessage(chat_id, "❌ Nothing is paused!"))
             
-    async def _handle_skip(self, query, context):
+    async def _handle_skip(self, query, context, chat_id: int):
         """Handle skip callback"""
-        chat_id = int(query.data.split("_")[1])
-        
         current_track = await self.audio_manager.get_current_track(chat_id)
         if current_track:
             await self.audio_manager.skip(chat_id)
-            await context.bot.send_message(
-                chat_id, 
-                f"⏭️ **Skipped:** {current_track['title']}", 
-                parse_mode='Markdown'
-            )
+            await self.egress.enqueue(SendMessage(
+                chat_id,
+                f"⏭️ **Skipped:** {current_track['title']}",
+                {'parse_mode': 'Markdown'}
+            ))
         else:
-            await context.bot.send_message(chat_id, "❌ Nothing is playing!")
+            await self.egress.enqueue(SendMessage(chat_id, "❌ Nothing is playing!"))
             
-    async def _handle_stop(self, query, context):
+    async def _handle_stop(self, query, context, chat_id: int):
         """Handle stop callback"""
-        chat_id = int(query.data.split("_")[1])
-        
         await self.audio_manager.stop(chat_id)
-        await context.bot.send_message(
-            chat_id, 
-            "⏹️ **Playback stopped and queue cleared**", 
-            parse_mode='Markdown'
-        )
+        await self.egress.enqueue(SendMessage(
+            chat_id,
+            "⏹️ <b>Playback stopped and queue cleared</b>",
+            {'parse_mode': 'HTML'}
+        ))
         
-    async def _handle_shuffle(self, query):
+    async def _handle_shuffle(self, query, context, chat_id: int):
         """Handle shuffle callback"""
-        chat_id = int(query.data.split("_")[1])
-        
         if await self.audio_manager.shuffle_queue(chat_id):
-            await query.edit_message_text("🔀 **Queue shuffled!**", parse_mode='Markdown')
+            await query.edit_message_text("🔀 <b>Queue shuffled!</b>", parse_mode='HTML')
         else:
             await query.edit_message_text("❌ Queue is empty!")
             
-    async def _handle_queue(self, query):
+    async def _handle_queue(self, query, context, chat_id: int):
         """Handle queue callback"""
-        chat_id = int(query.data.split("_")[1])
-        
-        queue = await self.audio_manager.get_queue(chat_id)
-        current_track = await self.audio_manager.get_current_track(chat_id)
+        queue, current_track = await asyncio.gather(
+            self.audio_manager.get_queue(chat_id),
+            self.audio_manager.get_current_track(chat_id)
+        )
         
         if not current_track and not queue:
-            await query.edit_message_text("📋 **Queue is empty!**", parse_mode='Markdown')
+            await query.edit_message_text("📋 <b>Queue is empty!</b>", parse_mode='HTML')
             return
             
-        message = "📋 **Current Queue:**\n\n"
+        parts = ["📋 **Current Queue:**\n\n"]
         
         if current_track:
-            message += f"🎵 **Now Playing:**\n{current_track['title']}\n\n"
+            parts.append(f"🎵 **Now Playing:**\n{current_track['title']}\n\n")
             
         if queue:
-            message += "**Up Next:**\n"
-            for i, track in enumerate(queue[:10], 1):
-                message += f"{i}. {track['title']}\n"
-                
-            if len(queue) > 10:
-                message += f"\n... and {len(queue) - 10} more tracks"
+            parts.append("**Up Next:**\n")
+            parts.extend(f"{i}. {track['title']}\n" for i, track in enumerate(islice(queue, 10), 1))
+            
+            extra = len(queue) - 10
+            if extra > 0:
+                parts.append(f"\n... and {extra} more tracks")
         else:
-            message += "**Queue is empty**"
+            parts.append("**Queue is empty**")
+        message = "".join(parts)
             
         keyboard = [
             [InlineKeyboardButton("🔀 Shuffle", callback_data=f"shuffle_{chat_id}"),
@@ -229,39 +327,26 @@ class CallbackHandler:
             parse_mode='Markdown'
         )
         
-    async def _handle_clear_queue(self, query):
+    async def _handle_clear_queue(self, query, context, chat_id: int):
         """Handle clear queue callback"""
-        chat_id = int(query.data.split("_")[2])
-        
         await self.audio_manager.clear_queue(chat_id)
-        await query.edit_message_text("🗑️ **Queue cleared!**", parse_mode='Markdown')
+        await query.edit_message_text("🗑️ <b>Queue cleared!</b>", parse_mode='HTML')
         
-    async def _handle_loop(self, query):
+    async def _handle_loop(self, query, context, chat_id: int):
         """Handle loop callback"""
-        chat_id = int(query.data.split("_")[1])
-        
         current_mode = await self.audio_manager.get_loop_mode(chat_id)
         
         # Cycle through loop modes
-        if current_mode == "off":
-            new_mode = "song"
-        elif current_mode == "song":
-            new_mode = "queue"
-        else:
-            new_mode = "off"
-            
+        new_mode = NEXT_LOOP_MODE.get(current_mode, "off")
         await self.audio_manager.set_loop_mode(chat_id, new_mode)
         
-        mode_emojis = {"off": "➡️", "song": "🔂", "queue": "🔁"}
         await query.edit_message_text(
-            f"{mode_emojis[new_mode]} **Loop mode: {new_mode}**",
+            f"{LOOP_MODE_EMOJIS[new_mode]} **Loop mode: {new_mode}**",
             parse_mode='Markdown'
         )
         
-    async def _handle_lyrics(self, query, context):
+    async def _handle_lyrics(self, query, context, chat_id: int):
         """Handle lyrics callback"""
-        chat_id = int(query.data.split("_")[1])
-        
         if not Config.ENABLE_LYRICS:
             await query.edit_message_text("❌ Lyrics feature is disabled!")
             return
@@ -271,20 +356,14 @@ class CallbackHandler:
             await query.edit_message_text("❌ Nothing is playing!")
             return
             
-        await query.edit_message_text("🔍 **Searching for lyrics...**", parse_mode='Markdown')
+        await query.edit_message_text("🔍 <b>Searching for lyrics...</b>", parse_mode='HTML')
         
         try:
-            from utils.youtube_downloader import YouTubeDownloader
-            youtube_dl = YouTubeDownloader()
-            lyrics = await youtube_dl.get_lyrics(current_track['title'])
+            lyrics = await self.youtube_dl.get_lyrics(current_track['title'])
             
             if lyrics:
-                # Split lyrics if too long
-                if len(lyrics) > 4000:
-                    lyrics = lyrics[:4000] + "...\n\n[Lyrics truncated]"
-                    
                 await query.edit_message_text(
-                    f"📝 **Lyrics for:** {current_track['title']}\n\n{lyrics}",
+                    LYRICS_TEMPLATE.format(title=current_track['title'], lyrics=lyrics),
                     parse_mode='Markdown'
                 )
             else:
@@ -293,45 +372,37 @@ class CallbackHandler:
             logger.error(f"Error getting lyrics: {e}")
             await query.edit_message_text("❌ Error getting lyrics!")
             
-    async def _handle_refresh_stats(self, query):
+    async def _handle_refresh_stats(self, query, context):
         """Handle refresh stats callback"""
-        await self._handle_stats(query)
+        await self._handle_stats(query, context)
         
-    async def _handle_detailed_stats(self, query):
+    async def _handle_detailed_stats(self, query, context):
         """Handle detailed stats callback"""
-        bot_stats = await self.db.get_bot_stats()
-        top_users = await self.db.get_top_users(10)
-        top_chats = await self.db.get_top_chats(10)
-        popular_songs = await self.db.get_popular_songs(10)
+        bot_stats, top_users, top_chats = await asyncio.gather(
+            self._cached("bot_stats", self.db.get_bot_stats),
+            self._cached("top_users", partial(self.db.get_top_users, 10)),
+            self._cached("top_chats", partial(self.db.get_top_chats, 10))
+        )
         
-        message = f"""📊 **Detailed Statistics**
-
-📈 **Bot Stats:**
-👥 Users: {bot_stats['total_users']}
-💬 Active Chats: {bot_stats['total_chats']}
-🎵 Total Songs: {bot_stats['total_songs_played']}
-🚀 Started: {bot_stats['bot_start_time'][:19] if bot_stats['bot_start_time'] else 'Unknown'}
-
-🏆 **Top Users:**
-"""
+        parts = [DETAILED_STATS_TEMPLATE.format(
+            total_users=bot_stats['total_users'],
+            total_chats=bot_stats['total_chats'],
+            total_songs_played=bot_stats['total_songs_played'],
+            bot_start_time=bot_stats['bot_start_time'][:19] if bot_stats['bot_start_time'] else 'Unknown'
+        )]
         
         for i, user in enumerate(top_users[:5], 1):
             name = user['first_name'] or user['username'] or f"User {user['user_id']}"
-            message += f"{i}. {name} - {user['total_songs_played']} songs\n"
+            parts.append(f"{i}. {name} - {user['total_songs_played']} songs\n")
             
-        message += "\n🏆 **Top Chats:**\n"
+        parts.append("\n🏆 **Top Chats:**\n")
         for i, chat in enumerate(top_chats[:5], 1):
             chat_name = chat['chat_title'] or f"Chat {chat['chat_id']}"
-            message += f"{i}. {chat_name} - {chat['total_songs_played']} songs\n"
+            parts.append(f"{i}. {chat_name} - {chat['total_songs_played']} songs\n")
             
-        keyboard = [
-            [InlineKeyboardButton("🔙 Back", callback_data="stats")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await query.edit_message_text(
-            message,
-            reply_markup=reply_markup,
+            "".join(parts),
+            reply_markup=self.BACK_TO_STATS_MARKUP,
             parse_mode='Markdown'
         )
         
@@ -341,7 +412,7 @@ class CallbackHandler:
         
         # Check if user is admin
         if user_id not in Config.SUDO_USERS:
-            await query.edit_message_text("🚫 **Access Denied!**", parse_mode='Markdown')
+            await query.edit_message_text("🚫 <b>Access Denied!</b>", parse_mode='HTML')
             return
             
         broadcast_message = context.user_data.get('broadcast_message')
@@ -349,16 +420,14 @@ class CallbackHandler:
             await query.edit_message_text("❌ No broadcast message found!")
             return
             
-        await query.edit_message_text("📢 **Starting broadcast...**", parse_mode='Markdown')
+        await query.edit_message_text("📢 <b>Starting broadcast...</b>", parse_mode='HTML')
         
         # Execute broadcast
-        from handlers.admin_handler import AdminHandler
-        admin_handler = AdminHandler(self.db)
-        await admin_handler.execute_broadcast(context, broadcast_message, query.message.chat_id)
+        await self.admin_handler.execute_broadcast(context, broadcast_message, query.message.chat_id)
         
-    async def _handle_cancel_broadcast(self, query):
+    async def _handle_cancel_broadcast(self, query, context):
         """Handle cancel broadcast callback"""
-        await query.edit_message_text("❌ **Broadcast cancelled**", parse_mode='Markdown')
+        await query.edit_message_text("❌ <b>Broadcast cancelled</b>", parse_mode='HTML')
         
     async def _handle_confirm_restart(self, query, context):
         """Handle confirm restart callback"""
@@ -366,25 +435,25 @@ class CallbackHandler:
         
         # Check if user is admin
         if user_id not in Config.SUDO_USERS:
-            await query.edit_message_text("🚫 **Access Denied!**", parse_mode='Markdown')
+            await query.edit_message_text("🚫 <b>Access Denied!</b>", parse_mode='HTML')
             return
             
-        await query.edit_message_text("🔄 **Restarting bot...**", parse_mode='Markdown')
-        
-        # Cleanup and restart
-        import os
-        import sys
+        await query.edit_message_text("🔄 <b>Restarting bot...</b>", parse_mode='HTML')
         
         try:
-            # Stop all music playback
-            for chat_id in list(self.audio_manager.current_tracks.keys()):
-                await self.audio_manager.stop(chat_id)
-                
+            # Stop all music playback, every chat at once
+            await asyncio.gather(
+                *(self.audio_manager.stop(chat_id) for chat_id in tuple(self.audio_manager.chat_states)),
+                return_exceptions=True
+            )
+            
             # Close database connections
             await self.db.close()
             
-            # Restart process
-            os.execv(sys.executable, ['python'] + sys.argv)
+            # Restart process once this handler has returned to the loop
+            asyncio.get_running_loop().call_soon(
+                self._restart_process, context.bot, query.message.chat_id
+            )
         except Exception as e:
             logger.error(f"Error restarting: {e}")
             await context.bot.send_message(
@@ -392,6 +461,20 @@ class CallbackHandler:
                 "❌ Error restarting bot!"
             )
             
-    async def _handle_cancel_restart(self, query):
+    def _restart_process(self, bot, chat_id: int):
+        """Replace this process with a fresh one, reporting the failure if that isn't possible"""
+        # atexit handlers don't run across execv, so write out queued log records now
+        listeners = [h.listener for h in logging.getLogger().handlers if getattr(h, 'listener', None)]
+        for listener in listeners:
+            listener.stop()
+        try:
+            os.execv(sys.executable, [sys.executable] + sys.argv)
+        except Exception as e:
+            for listener in listeners:
+                listener.start()
+            logger.error(f"Error restarting: {e}")
+            spawn(bot.send_message(chat_id, "❌ Error restarting bot!"))
+            
+    async def _handle_cancel_restart(self, query, context):
         """Handle cancel restart callback"""
-        await query.edit_message_text("❌ **Restart cancelled**", parse_mode='Markdown')
\ No newline at end of file
+        await query.edit_message_text("❌ <b>Restart cancelled</b>", parse_mode='HTML')
\ No newline at end of file
@@ -4,20 +4,52 @@ Music Handler - Handles all music-related commands
 
 import asyncio
 import logging
-import random
+from itertools import islice
 from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from telegram.constants import ChatAction
 from config import Config
+from messages import START_MESSAGE, HELP_MESSAGE, LYRICS_TEMPLATE
 from utils.database import Database
 from utils.audio_manager import AudioManager
 from utils.youtube_downloader import YouTubeDownloader
-from utils.decorators import rate_limit, is_user_banned
+from utils.decorators import handler, is_user_banned
 
 logger = logging.getLogger(__name__)
 
+LOOP_MODES = frozenset({"off", "song", "queue"})
+
+NOW_PLAYING_TEMPLATE = """🎵 **Now Playing:**
+**Title:** {title}
+**Duration:** {duration}
+**Requested by:** {requester}"""
+
+ADDED_TO_QUEUE_TEMPLATE = """✅ **Added to Queue (Position #{position}):**
+**Title:** {title}
+**Duration:** {duration}
+**Requested by:** {requester}"""
+
+NOW_PLAYING_DETAILS_TEMPLATE = """🎵 **Now Playing:**
+**Title:** {title}
+**Duration:** {duration}
+**Progress:** {progress}
+**Volume:** {volume}%
+**Requested by:** <a href='tg://user?id={requested_by}'>{requester_name}</a>"""
+
+def _abandon(task: asyncio.Task):
+    """Cancel a task nobody will await, retrieving its outcome if it already finished with an error"""
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
 class MusicHandler:
+    # The /start keyboard never changes, build it once
+    START_MARKUP = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🎵 Join Voice Chat", callback_data="join_vc")],
+        [InlineKeyboardButton("📋 Help", callback_data="help"),
+         InlineKeyboardButton("📊 Stats", callback_data="stats")]
+    ])
+    
     def __init__(self, db: Database, audio_manager: AudioManager):
         self.db = db
         self.audio_manager = audio_manager
@@ -28,32 +60,26 @@ class MusicHandler:
         user = update.effective_user
         chat = update.effective_chat
         
-        # Add user to database
-        await self.db.add_user(user.id, user.username, user.first_name)
-        await self.db.add_chat(chat.id, chat.title if chat.title else f"Private_{user.id}")
-        
-        keyboard = [
-            [InlineKeyboardButton("🎵 Join Voice Chat", callback_data="join_vc")],
-            [InlineKeyboardButton("📋 Help", callback_data="help"),
-             InlineKeyboardButton("📊 Stats", callback_data="stats")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Add user and chat to database
+        await self.db.add_user_and_chat(
+            user.id, user.username, user.first_name,
+            chat.id, chat.title if chat.title else f"Private_{user.id}"
+        )
         
         await update.message.reply_text(
-            Config.START_MESSAGE,
-            reply_markup=reply_markup,
+            START_MESSAGE,
+            reply_markup=self.START_MARKUP,
             parse_mode='Markdown'
         )
         
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Help command handler"""
         await update.message.reply_text(
-            Config.HELP_MESSAGE,
+            HELP_MESSAGE,
             parse_mode='Markdown'
         )
         
-    @rate_limit
-    @is_user_banned
+    @handler(rate=True)
     async def play(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Play command handler"""
         chat_id = update.effective_chat.id
@@ -67,28 +93,34 @@ class MusicHandler:
             )
             return
             
-        query = " ".join(context.args)
+        # Everything after the command; args is non-empty so there is a second part
+        query = update.message.text.split(None, 1)[1].strip()
         
-        # Send typing action
-        await context.bot.send_chat_action(chat_id, ChatAction.TYPING)
+        # The search doesn't depend on the voice chat, start it straight away
+        search_task = asyncio.ensure_future(self.youtube_dl.search_and_download(query))
         
-        # Check if bot is in voice chat
-        if not await self.audio_manager.is_in_voice_chat(chat_id):
-            try:
-                await self.audio_manager.join_voice_chat(chat_id)
-            except Exception as e:
-                await update.message.reply_text(
-                    f"❌ Couldn't join voice chat: {str(e)}\n"
-                    "Make sure there's an active voice chat and I have proper permissions!"
-                )
-                return
+        _, joined, processing_msg = await asyncio.gather(
+            context.bot.send_chat_action(chat_id, ChatAction.TYPING),
+            self._ensure_in_voice_chat(chat_id),
+            update.message.reply_text("🔍 Searching for music..."),
+            return_exceptions=True
+        )
         
-        # Show processing message
-        processing_msg = await update.message.reply_text("🔍 Searching for music...")
+        if isinstance(processing_msg, Exception):
+            _abandon(search_task)
+            raise processing_msg
+            
+        if isinstance(joined, Exception):
+            _abandon(search_task)
+            await processing_msg.edit_text(
+                f"❌ Couldn't join voice chat: {str(joined)}\n"
+                "Make sure there's an active voice chat and I have proper permissions!"
+            )
+            return
         
         try:
             # Search and download
-            track_info = await self.youtube_dl.search_and_download(query)
+            track_info = await search_task
             
             if not track_info:
                 await processing_msg.edit_text("❌ No results found for your query!")
@@ -112,19 +144,22 @@ class MusicHandler:
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 
                 await processing_msg.edit_text(
-                    f"🎵 **Now Playing:**\n"
-                    f"**Title:** {track_info['title']}\n"
-                    f"**Duration:** {track_info['duration']}\n"
-                    f"**Requested by:** {update.effective_user.mention_html()}",
+                    NOW_PLAYING_TEMPLATE.format(
+                        title=track_info['title'],
+                        duration=track_info['duration'],
+                        requester=update.effective_user.mention_html()
+                    ),
                     reply_markup=reply_markup,
                     parse_mode='HTML'
                 )
             else:
                 await processing_msg.edit_text(
-                    f"✅ **Added to Queue (Position #{queue_position}):**\n"
-                    f"**Title:** {track_info['title']}\n"
-                    f"**Duration:** {track_info['duration']}\n"
-                    f"**Requested by:** {update.effective_user.mention_html()}",
+                    ADDED_TO_QUEUE_TEMPLATE.format(
+                        position=queue_position,
+                        title=track_info['title'],
+                        duration=track_info['duration'],
+                        requester=update.effective_user.mention_html()
+                    ),
                     parse_mode='HTML'
                 )
                 
@@ -135,6 +170,11 @@ class MusicHandler:
                 parse_mode='Markdown'
             )
             
+    async def _ensure_in_voice_chat(self, chat_id: int):
+        """Join the chat's voice chat unless already connected"""
+        if not await self.audio_manager.is_in_voice_chat(chat_id):
+            await self.audio_manager.join_voice_chat(chat_id)
+            
     @is_user_banned
     async def pause(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Pause current playback"""
@@ -191,20 +231,21 @@ class MusicHandler:
             await update.message.reply_text("📋 **Queue is empty!**", parse_mode='Markdown')
             return
             
-        message = "📋 **Current Queue:**\n\n"
+        parts = ["📋 **Current Queue:**\n\n"]
         
         if current_track:
-            message += f"🎵 **Now Playing:**\n{current_track['title']}\n\n"
+            parts.append(f"🎵 **Now Playing:**\n{current_track['title']}\n\n")
             
         if queue:
-            message += "**Up Next:**\n"
-            for i, track in enumerate(queue[:10], 1):
-                message += f"{i}. {track['title']}\n"
-                
-            if len(queue) > 10:
-                message += f"\n... and {len(queue) - 10} more tracks"
+            parts.append("**Up Next:**\n")
+            parts.extend(f"{i}. {track['title']}\n" for i, track in enumerate(islice(queue, 10), 1))
+            
+            extra = len(queue) - 10
+            if extra > 0:
+                parts.append(f"\n... and {extra} more tracks")
         else:
-            message += "**Queue is empty**"
+            parts.append("**Queue is empty**")
+        message = "".join(parts)
             
         keyboard = [
             [InlineKeyboardButton("🔀 Shuffle", callback_data=f"shuffle_{chat_id}"),
@@ -241,12 +282,14 @@ class MusicHandler:
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         await update.message.reply_text(
-            f"🎵 **Now Playing:**\n"
-            f"**Title:** {current_track['title']}\n"
-            f"**Duration:** {current_track['duration']}\n"
-            f"**Progress:** {progress}\n"
-            f"**Volume:** {volume}%\n"
-            f"**Requested by:** <a href='tg://user?id={current_track['requested_by']}'>{current_track['requester_name']}</a>",
+            NOW_PLAYING_DETAILS_TEMPLATE.format(
+                title=current_track['title'],
+                duration=current_track['duration'],
+                progress=progress,
+                volume=volume,
+                requested_by=current_track['requested_by'],
+                requester_name=current_track['requester_name']
+            ),
             reply_markup=reply_markup,
             parse_mode='HTML'
         )
@@ -277,7 +320,7 @@ class MusicHandler:
             return
             
         mode = context.args[0].lower()
-        if mode not in ['off', 'song', 'queue']:
+        if mode not in LOOP_MODES:
             await update.message.reply_text("❌ Invalid loop mode! Use: off, song, or queue")
             return
             
@@ -301,11 +344,9 @@ class MusicHandler:
             )
             return
             
-        try:
-            volume_level = int(context.args[0])
-            if not 1 <= volume_level <= 200:
-                raise ValueError
-        except ValueError:
+        # isdecimal() accepts exactly what int() parses here, so no exception path is needed
+        arg = context.args[0]
+        if not arg.isdecimal() or not 1 <= (volume_level := int(arg)) <= 200:
             await update.message.reply_text("❌ Volume must be between 1 and 200!")
             return
             
@@ -334,12 +375,8 @@ class MusicHandler:
         try:
             lyrics = await self.youtube_dl.get_lyrics(current_track['title'])
             if lyrics:
-                # Split lyrics if too long
-                if len(lyrics) > 4000:
-                    lyrics = lyrics[:4000] + "...\n\n[Lyrics truncated]"
-                    
                 await update.message.reply_text(
-                    f"📝 **Lyrics for:** {current_track['title']}\n\n{lyrics}",
+                    LYRICS_TEMPLATE.format(title=current_track['title'], lyrics=lyrics),
                     parse_mode='Markdown'
                 )
             else:
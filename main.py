@@ -4,8 +4,11 @@ Advanced Telegram Music Bot - Main Entry Point
 """
 
 import asyncio
+import atexit
 import logging
 import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler
 from config import Config
 from handlers.music_handler import MusicHandler
@@ -13,51 +16,78 @@ from handlers.admin_handler import AdminHandler
 from handlers.callback_handler import CallbackHandler
 from utils.database import Database
 from utils.audio_manager import AudioManager
+from utils.telegram_egress import TelegramEgress
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
-)
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Configure logging: records are queued and written by a listener thread,
+# so file and console writes never block the event loop
+_log_handlers = [
+    logging.FileHandler('bot.log'),
+    logging.StreamHandler()
+]
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+    
+_log_queue: queue.Queue = queue.Queue(-1)
+_queue_handler = QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))  # Real formatting happens on the listener
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+_log_listener = QueueListener(_log_queue, *_log_handlers)
+_queue_handler.listener = _log_listener  # Lets the restart path stop it before execv
+_log_listener.start()
+atexit.register(_log_listener.stop)  # Flushes whatever is still queued
 logger = logging.getLogger(__name__)
 
+# Seconds between download folder trims
+DOWNLOADS_PRUNE_INTERVAL = 600
+
+# Seconds between refreshes of the database's query planner statistics
+DB_OPTIMIZE_INTERVAL = 3600
+
 class MusicBot:
     def __init__(self):
-        self.app = Application.builder().token(Config.BOT_TOKEN).build()
+        # Process updates from different users concurrently instead of one at a time
+        self.app = Application.builder().token(Config.BOT_TOKEN).concurrent_updates(True).build()
         self.db = Database()
         self.audio_manager = AudioManager()
+        self.egress = TelegramEgress(self.app.bot)
         self.music_handler = MusicHandler(self.db, self.audio_manager)
-        self.admin_handler = AdminHandler(self.db)
-        self.callback_handler = CallbackHandler(self.db, self.audio_manager)
+        self.admin_handler = AdminHandler(self.db, youtube_dl=self.music_handler.youtube_dl)
+        self.callback_handler = CallbackHandler(
+            self.db, self.audio_manager, self.egress,
+            admin_handler=self.admin_handler,
+            youtube_dl=self.music_handler.youtube_dl
+        )
         
     def setup_handlers(self):
         """Setup all command and message handlers"""
-        # Command handlers
+        # Command handlers (network-bound ones use block=False so they run as their own tasks)
         self.app.add_handler(CommandHandler("start", self.music_handler.start))
         self.app.add_handler(CommandHandler("help", self.music_handler.help_command))
-        self.app.add_handler(CommandHandler("play", self.music_handler.play))
-        self.app.add_handler(CommandHandler("p", self.music_handler.play))
+        self.app.add_handler(CommandHandler("play", self.music_handler.play, block=False))
+        self.app.add_handler(CommandHandler("p", self.music_handler.play, block=False))
         self.app.add_handler(CommandHandler("pause", self.music_handler.pause))
         self.app.add_handler(CommandHandler("resume", self.music_handler.resume))
-        self.app.add_handler(CommandHandler("skip", self.music_handler.skip))
-        self.app.add_handler(CommandHandler("stop", self.music_handler.stop))
+        self.app.add_handler(CommandHandler("skip", self.music_handler.skip, block=False))
+        self.app.add_handler(CommandHandler("stop", self.music_handler.stop, block=False))
         self.app.add_handler(CommandHandler("queue", self.music_handler.show_queue))
         self.app.add_handler(CommandHandler("q", self.music_handler.show_queue))
         self.app.add_handler(CommandHandler("np", self.music_handler.now_playing))
         self.app.add_handler(CommandHandler("shuffle", self.music_handler.shuffle_queue))
         self.app.add_handler(CommandHandler("loop", self.music_handler.loop))
         self.app.add_handler(CommandHandler("volume", self.music_handler.volume))
-        self.app.add_handler(CommandHandler("lyrics", self.music_handler.lyrics))
+        self.app.add_handler(CommandHandler("lyrics", self.music_handler.lyrics, block=False))
         
         # Admin handlers
         self.app.add_handler(CommandHandler("stats", self.admin_handler.stats))
         self.app.add_handler(CommandHandler("ban", self.admin_handler.ban_user))
         self.app.add_handler(CommandHandler("unban", self.admin_handler.unban_user))
-        self.app.add_handler(CommandHandler("broadcast", self.admin_handler.broadcast))
+        self.app.add_handler(CommandHandler("broadcast", self.admin_handler.broadcast, block=False))
         
         # Callback query handler
         self.app.add_handler(CallbackQueryHandler(self.callback_handler.handle_callback))
@@ -67,12 +97,27 @@ class MusicBot:
             filters.StatusUpdate.VIDEO_CHAT_STARTED |
             filters.StatusUpdate.VIDEO_CHAT_ENDED |
             filters.StatusUpdate.VIDEO_CHAT_PARTICIPANTS_INVITED,
-            self.music_handler.voice_chat_update
+            self.music_handler.voice_chat_update,
+            block=False
         ))
         
         # Error handler
         self.app.add_error_handler(self.error_handler)
         
+        # Periodic maintenance
+        self.app.job_queue.run_repeating(self.prune_downloads, interval=DOWNLOADS_PRUNE_INTERVAL,
+                                         first=DOWNLOADS_PRUNE_INTERVAL)
+        self.app.job_queue.run_repeating(self.optimize_database, interval=DB_OPTIMIZE_INTERVAL,
+                                         first=DB_OPTIMIZE_INTERVAL)
+        
+    async def prune_downloads(self, context):
+        """Trim cached audio back under the disk budget"""
+        await self.music_handler.youtube_dl.trim_downloads()
+        
+    async def optimize_database(self, context):
+        """Keep query planner statistics fresh as history grows"""
+        await self.db.optimize()
+        
     async def error_handler(self, update, context):
         """Handle errors"""
         logger.error(f"Update {update} caused error {context.error}")
@@ -81,6 +126,7 @@ class MusicBot:
         """Initialize bot components"""
         await self.db.initialize()
         await self.audio_manager.initialize()  # <-- ADD THIS
+        self.egress.start()
         logger.info("Bot initialized successfully")
         
     async def start_bot(self):
@@ -100,10 +146,12 @@ class MusicBot:
             logger.info("Bot stopped by user")
         finally:
             await self.app.stop()
+            await self.egress.stop()
             await self.db.close()
 
 async def main():
     """Main function"""
+    Config.ensure_paths()
     bot = MusicBot()
     await bot.start_bot()
 
@@ -116,6 +164,10 @@ if __name__ == "__main__":
         logger.error(f"Missing required environment variables: {', '.join(missing_vars)}")
         exit(1)
     
+    # libuv-backed event loop when available, the default asyncio loop otherwise
+    if uvloop is not None:
+        uvloop.install()
+        
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
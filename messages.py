@@ -0,0 +1,64 @@
+"""
+Static bot messages - kept out of config so importing it stays cheap
+"""
+
+START_MESSAGE = """
+🎵 **Welcome to Advanced Music Bot!**
+
+I can play music in your voice chats with many advanced features:
+
+**Basic Commands:**
+• /play [song name/url] - Play music
+• /pause - Pause current song
+• /resume - Resume playback
+• /skip - Skip current song
+• /stop - Stop playback and clear queue
+• /queue - Show current queue
+• /np - Show now playing
+
+**Advanced Features:**
+• /shuffle - Shuffle queue
+• /loop [off/song/queue] - Loop mode
+• /volume [1-200] - Adjust volume
+• /lyrics - Get song lyrics
+
+Type /help for more commands!
+"""
+
+HELP_MESSAGE = """
+🎵 **Music Bot Commands**
+
+**Music Control:**
+• `/play` or `/p` - Play song from YouTube/Spotify/URL
+• `/pause` - Pause current song
+• `/resume` - Resume playback
+• `/skip` - Skip to next song
+• `/stop` - Stop music and clear queue
+
+**Queue Management:**
+• `/queue` or `/q` - Show current queue
+• `/shuffle` - Shuffle current queue
+• `/loop` [off/song/queue] - Set loop mode
+
+**Information:**
+• `/np` - Show currently playing song
+• `/lyrics` - Get lyrics for current song
+• `/volume` [1-200] - Adjust playback volume
+
+**Admin Commands:**
+• `/stats` - Show bot statistics
+• `/ban` [user_id] - Ban user from bot
+• `/unban` [user_id] - Unban user
+• `/broadcast` [message] - Send message to all users
+
+**Supported Sources:**
+• YouTube (links and search)
+• Spotify (if enabled)
+• Direct audio file URLs
+
+Join a voice chat and start playing music! 🎶
+"""
+
+LYRICS_TEMPLATE = """📝 **Lyrics for:** {title}
+
+{lyrics}"""
@@ -90,6 +90,7 @@ RATE_LIMIT_WINDOW=60
 
 # File Paths
 DOWNLOADS_PATH=./downloads
+MAX_DOWNLOADS_SIZE_MB=5120
 LOGS_PATH=./logs
 
 # Features
@@ -7,17 +7,41 @@ import os
 import logging
 import random
 import asyncio
-from typing import Dict, List, Optional
+import functools
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set
 from pytgcalls import PyTgCalls
 from pytgcalls.types import MediaStream as AudioPiped
 from pytgcalls.types.stream import AudioQuality as HighQualityAudio
 from pytgcalls.types import Update
 from pytgcalls.types import StreamEnded
+from pytgcalls.types import ChatUpdate
 from pyrogram import Client
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Bundled silent track used to attach to a call before anything is queued
+SILENCE_PATH = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'assets', 'silence.mp3'))
+
+# Queues longer than this are shuffled off the event loop
+SHUFFLE_OFFLOAD_SIZE = 500
+
+# Stream descriptors kept for reuse (loop modes replay the same files)
+STREAM_CACHE_SIZE = 64
+
+@dataclass
+class ChatState:
+    """Playback state for one chat"""
+    queue: Deque[Dict] = field(default_factory=deque)  # deque so play_next pops from the front in O(1)
+    current_track: Optional[Dict] = None
+    loop_mode: str = "off"  # off, song, queue
+    volume: int = Config.DEFAULT_VOLUME
+    paused: bool = False
+    active: bool = False  # Connected to the voice chat, kept in step with join/leave and chat updates
+    joining: Optional[asyncio.Task] = None  # Join in progress, awaited by concurrent callers instead of joining twice
+
 class AudioManager:
     def __init__(self):
         # Use user account for voice chat functionality
@@ -47,12 +71,15 @@ class AudioManager:
         # Use user client for PyTgCalls
         self.pytgcalls = PyTgCalls(self.pyrogram_client)
         
-        # Chat states
-        self.queues: Dict[int, List[Dict]] = {}
-        self.current_tracks: Dict[int, Optional[Dict]] = {}
-        self.loop_modes: Dict[int, str] = {}  # off, song, queue
-        self.volumes: Dict[int, int] = {}
-        self.paused_chats: set = set()
+        # Chat states, one entry per chat so cleanup is a single pop
+        self.chat_states: Dict[int, ChatState] = {}
+        
+        # Per-chat job queues: work for one chat runs in order, chats don't wait on each other
+        self._chat_workers: Dict[int, asyncio.Queue] = {}
+        self._worker_tasks: Set[asyncio.Task] = set()
+        
+        # file_path -> MediaStream, least recently used first
+        self._stream_cache: "OrderedDict[str, AudioPiped]" = OrderedDict()
         
     async def initialize(self):
         """Initialize the audio manager"""
@@ -66,22 +93,37 @@ class AudioManager:
         async def stream_update_handler(_, update: Update):
             if isinstance(update, StreamEnded):
                 await self._on_stream_end(_, update)
+            elif isinstance(update, ChatUpdate) and update.status & ChatUpdate.Status.LEFT_CALL:
+                # Kicked, removed from the group or the voice chat was closed
+                state = self.chat_states.get(update.chat_id)
+                if state:
+                    state.active = False
     
         logger.info("Audio manager initialized with user account")
         
     async def cleanup(self):
         """Cleanup resources"""
+        for task in list(self._worker_tasks):
+            task.cancel()
         await self.pytgcalls.stop()
         await self.pyrogram_client.stop()
         await self.bot_client.stop()
         
+    def _stream(self, file_path: str) -> AudioPiped:
+        """Get the stream descriptor for a file, reusing one built earlier"""
+        stream = self._stream_cache.get(file_path)
+        if stream is None:
+            stream = self._stream_cache[file_path] = AudioPiped(file_path, HighQualityAudio.HIGH)
+            if len(self._stream_cache) > STREAM_CACHE_SIZE:
+                self._stream_cache.popitem(last=False)
+        else:
+            self._stream_cache.move_to_end(file_path)
+        return stream
+        
     async def is_in_voice_chat(self, chat_id: int) -> bool:
         """Check if bot is in voice chat"""
-        try:
-            call = await self.pytgcalls.get_call(chat_id)
-            return call is not None
-        except:
-            return False
+        state = self.chat_states.get(chat_id)
+        return state is not None and state.active
             
     async def check_voice_chat_exists(self, chat_id: int) -> bool:
         """Check if there's an active voice chat in the group"""
@@ -100,6 +142,22 @@ class AudioManager:
             
     async def join_voice_chat(self, chat_id: int, file_path: Optional[str] = None):
         """Join voice chat - requires existing voice chat"""
+        state = self.chat_states.setdefault(chat_id, ChatState())
+        if state.joining is None:
+            state.joining = asyncio.ensure_future(self._join_voice_chat(chat_id, state, file_path))
+            state.joining.add_done_callback(functools.partial(self._join_done, state))
+        # Shielded so one caller giving up doesn't abort the join for the others
+        await asyncio.shield(state.joining)
+        
+    @staticmethod
+    def _join_done(state: ChatState, task: asyncio.Task):
+        """Clear a finished join, retrieving its error in case every waiter was cancelled"""
+        state.joining = None
+        if not task.cancelled():
+            task.exception()
+            
+    async def _join_voice_chat(self, chat_id: int, state: ChatState, file_path: Optional[str]):
+        """Perform the actual join for join_voice_chat"""
         try:
             logger.info(f"[DEBUG] Attempting to join VC in chat_id={chat_id}")
     
@@ -107,26 +165,19 @@ class AudioManager:
             if not await self.check_voice_chat_exists(chat_id):
                 raise Exception("No active voice chat found. Please start a voice chat in the group first!")
     
-            # Initialize chat state
-            if chat_id not in self.queues:
-                self.queues[chat_id] = []
-                self.current_tracks[chat_id] = None
-                self.loop_modes[chat_id] = "off"
-                self.volumes[chat_id] = Config.DEFAULT_VOLUME
-    
             if not file_path:
-                file_path = os.path.join(os.path.dirname(__file__), '../assets/silence.mp3')
+                file_path = SILENCE_PATH
     
             logger.info(f"[DEBUG] Joining existing voice chat with file={file_path}")
             
             # Join existing voice chat (don't create)
             await self.pytgcalls.join_group_call(
                 chat_id,
-                AudioPiped(file_path, HighQualityAudio.HIGH)
+                self._stream(file_path)
             )
+            state.active = True
     
-            volume = self.volumes.get(chat_id, Config.DEFAULT_VOLUME)
-            await self.pytgcalls.change_volume_call(chat_id, volume)
+            await self.pytgcalls.change_volume_call(chat_id, state.volume)
     
             logger.info(f"Successfully joined voice chat in {chat_id}")
     
@@ -139,55 +190,51 @@ class AudioManager:
         try:
             await self.pytgcalls.leave_group_call(chat_id)
             # Clean up chat state
-            self.queues.pop(chat_id, None)
-            self.current_tracks.pop(chat_id, None)
-            self.loop_modes.pop(chat_id, None)
-            self.volumes.pop(chat_id, None)
-            self.paused_chats.discard(chat_id)
+            self.chat_states.pop(chat_id, None)
             logger.info(f"Left voice chat in {chat_id}")
         except Exception as e:
             logger.error(f"Error leaving voice chat {chat_id}: {e}")
             
     async def add_to_queue(self, chat_id: int, track_info: Dict, user_id: int) -> int:
         """Add track to queue and return position"""
-        if chat_id not in self.queues:
-            self.queues[chat_id] = []
+        queue = self.chat_states.setdefault(chat_id, ChatState()).queue
             
         # Check queue size limit
-        if len(self.queues[chat_id]) >= Config.MAX_QUEUE_SIZE:
+        if len(queue) >= Config.MAX_QUEUE_SIZE:
             raise Exception(f"Queue is full! Maximum {Config.MAX_QUEUE_SIZE} tracks allowed.")
             
         track_info['requested_by'] = user_id
         track_info['requester_name'] = "Unknown"  # Will be updated by caller
         
-        self.queues[chat_id].append(track_info)
-        return len(self.queues[chat_id])
+        queue.append(track_info)
+        return len(queue)
         
     async def play_next(self, chat_id: int) -> bool:
         """Play next track in queue"""
-        if chat_id not in self.queues or not self.queues[chat_id]:
+        state = self.chat_states.get(chat_id)
+        if not state or not state.queue:
             return False
     
-        next_track = self.queues[chat_id].pop(0)
-        self.current_tracks[chat_id] = next_track
+        next_track = state.queue.popleft()
+        state.current_track = next_track
     
         try:
-            if await self.is_in_voice_chat(chat_id):
-                # Already in VC, just change the stream
+            if state.active:
+                # Already in VC, just change the stream (the call keeps its volume)
                 await self.pytgcalls.change_stream(
                     chat_id,
-                    AudioPiped(next_track['file_path'], HighQualityAudio.HIGH)
+                    self._stream(next_track['file_path'])
                 )
             else:
                 # Join voice chat and start playing
                 await self.pytgcalls.join_group_call(
                     chat_id,
-                    AudioPiped(next_track['file_path'], HighQualityAudio.HIGH)
+                    self._stream(next_track['file_path'])
                 )
-    
-            # Set volume
-            volume = self.volumes.get(chat_id, Config.DEFAULT_VOLUME)
-            await self.pytgcalls.change_volume_call(chat_id, volume)
+                state.active = True
+                
+                # Set volume
+                await self.pytgcalls.change_volume_call(chat_id, state.volume)
     
             logger.info(f"Playing {next_track['title']} in chat {chat_id}")
             return True
@@ -200,10 +247,11 @@ class AudioManager:
     
     async def pause(self, chat_id: int) -> bool:
         """Pause playback"""
+        state = self.chat_states.get(chat_id)
         try:
-            if await self.is_in_voice_chat(chat_id) and chat_id not in self.paused_chats:
+            if state and state.active and not state.paused:
                 await self.pytgcalls.pause_stream(chat_id)
-                self.paused_chats.add(chat_id)
+                state.paused = True
                 return True
         except Exception as e:
             logger.error(f"Error pausing in {chat_id}: {e}")
@@ -211,10 +259,11 @@ class AudioManager:
         
     async def resume(self, chat_id: int) -> bool:
         """Resume playback"""
+        state = self.chat_states.get(chat_id)
         try:
-            if chat_id in self.paused_chats:
+            if state and state.paused:
                 await self.pytgcalls.resume_stream(chat_id)
-                self.paused_chats.remove(chat_id)
+                state.paused = False
                 return True
         except Exception as e:
             logger.error(f"Error resuming in {chat_id}: {e}")
@@ -222,9 +271,11 @@ class AudioManager:
         
     async def skip(self, chat_id: int) -> bool:
         """Skip current track"""
-        if chat_id in self.current_tracks:
-            return await self.play_next(chat_id)
-        return False
+        if chat_id not in self.chat_states:
+            return False
+        # Queued on the chat's worker: returns at once and stays ordered with stream-end events
+        self._dispatch(chat_id, functools.partial(self.play_next, chat_id))
+        return True
         
     async def stop(self, chat_id: int):
         """Stop playback and clear queue"""
@@ -234,43 +285,63 @@ class AudioManager:
         except Exception as e:
             logger.error(f"Error stopping playback in {chat_id}: {e}")
             
-    async def get_queue(self, chat_id: int) -> List[Dict]:
+    async def get_queue(self, chat_id: int) -> Deque[Dict]:
         """Get current queue"""
-        return self.queues.get(chat_id, [])
+        state = self.chat_states.get(chat_id)
+        return state.queue if state else deque()
         
     async def get_current_track(self, chat_id: int) -> Optional[Dict]:
         """Get currently playing track"""
-        return self.current_tracks.get(chat_id)
+        state = self.chat_states.get(chat_id)
+        return state.current_track if state else None
         
     async def shuffle_queue(self, chat_id: int) -> bool:
         """Shuffle the queue"""
-        if chat_id in self.queues and self.queues[chat_id]:
-            random.shuffle(self.queues[chat_id])
+        state = self.chat_states.get(chat_id)
+        queue = state.queue if state else None
+        if queue:
+            # Shuffle a list copy (deque indexing is O(n) in the middle), then refill in place
+            tracks = list(queue)
+            if len(tracks) > SHUFFLE_OFFLOAD_SIZE:
+                shuffled = await asyncio.to_thread(random.sample, tracks, len(tracks))
+                if len(queue) != len(tracks) or any(a is not b for a, b in zip(queue, tracks)):
+                    # The queue changed while we were away, shuffle what's there now
+                    shuffled = list(queue)
+                    random.shuffle(shuffled)
+                tracks = shuffled
+            else:
+                random.shuffle(tracks)
+            queue.clear()
+            queue.extend(tracks)
             return True
         return False
         
     async def clear_queue(self, chat_id: int):
         """Clear the queue"""
-        if chat_id in self.queues:
-            self.queues[chat_id].clear()
+        state = self.chat_states.get(chat_id)
+        if state:
+            state.queue.clear()
             
     async def get_loop_mode(self, chat_id: int) -> str:
         """Get loop mode"""
-        return self.loop_modes.get(chat_id, "off")
+        state = self.chat_states.get(chat_id)
+        return state.loop_mode if state else "off"
         
     async def set_loop_mode(self, chat_id: int, mode: str):
         """Set loop mode"""
-        self.loop_modes[chat_id] = mode
+        self.chat_states.setdefault(chat_id, ChatState()).loop_mode = mode
         
     async def get_volume(self, chat_id: int) -> int:
         """Get volume"""
-        return self.volumes.get(chat_id, Config.DEFAULT_VOLUME)
+        state = self.chat_states.get(chat_id)
+        return state.volume if state else Config.DEFAULT_VOLUME
         
     async def set_volume(self, chat_id: int, volume: int):
         """Set volume"""
-        self.volumes[chat_id] = volume
+        state = self.chat_states.setdefault(chat_id, ChatState())
+        state.volume = volume
         try:
-            if await self.is_in_voice_chat(chat_id):
+            if state.active:
                 await self.pytgcalls.change_volume_call(chat_id, volume)
         except Exception as e:
             logger.error(f"Error setting volume in {chat_id}: {e}")
@@ -289,28 +360,55 @@ class AudioManager:
         logger.info(f"Voice chat ended in {chat_id}")
         await self.stop(chat_id)
         
+    def _dispatch(self, chat_id: int, job: Callable[[], Awaitable]):
+        """Queue a job for the chat, starting its worker if it isn't running"""
+        queue = self._chat_workers.get(chat_id)
+        if queue is None:
+            queue = self._chat_workers[chat_id] = asyncio.Queue()
+            task = asyncio.create_task(self._chat_worker_loop(chat_id, queue))
+            self._worker_tasks.add(task)
+            task.add_done_callback(self._worker_tasks.discard)
+        queue.put_nowait(job)
+        
+    async def _chat_worker_loop(self, chat_id: int, queue: asyncio.Queue):
+        """Run a chat's queued jobs one at a time, exiting once the queue is drained"""
+        try:
+            while not queue.empty():
+                job = queue.get_nowait()
+                try:
+                    await job()
+                except Exception as e:
+                    logger.error(f"Error handling playback event in {chat_id}: {e}")
+        finally:
+            self._chat_workers.pop(chat_id, None)
+        
     async def _on_stream_end(self, client, update: StreamEnded):
         """Handle stream end event"""
-        chat_id = update.chat_id
+        # Hand off to the chat's worker so a slow chat doesn't hold up pytgcalls' dispatcher
+        self._dispatch(update.chat_id, functools.partial(self._handle_stream_end, update.chat_id))
+        
+    async def _handle_stream_end(self, chat_id: int):
+        """Advance playback after a stream ended"""
         logger.info(f"Stream ended in chat {chat_id}")
         
         # Handle loop modes
-        loop_mode = self.loop_modes.get(chat_id, "off")
-        current_track = self.current_tracks.get(chat_id)
+        state = self.chat_states.get(chat_id)
+        loop_mode = state.loop_mode if state else "off"
+        current_track = state.current_track if state else None
         
         if loop_mode == "song" and current_track:
             # Repeat current song
             try:
                 await self.pytgcalls.change_stream(
                     chat_id,
-                    AudioPiped(current_track['file_path'], HighQualityAudio.HIGH)
+                    self._stream(current_track['file_path'])
                 )
             except Exception as e:
                 logger.error(f"Error repeating song in {chat_id}: {e}")
                 
         elif loop_mode == "queue" and current_track:
             # Add current song back to end of queue
-            self.queues[chat_id].append(current_track)
+            state.queue.append(current_track)
             await self.play_next(chat_id)
             
         else:
@@ -5,186 +5,287 @@ Database Manager - Handles all database operations
 import asyncio
 import logging
 import sqlite3
-from typing import Optional, List, Dict, Any
+from contextlib import asynccontextmanager
+from typing import Optional, List, Dict, Any, Set, AsyncIterator
 from datetime import datetime
 import aiosqlite
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Connections kept open for the lifetime of the bot
+DB_POOL_SIZE = 5
+
+# Prepared statements kept per connection
+DB_STATEMENT_CACHE_SIZE = 256
+
+# User IDs fetched per page when iterating every user
+USER_BATCH_SIZE = 500
+
+# Per-connection settings, applied when each pooled connection is opened
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",  # Safe under WAL, no fsync on every commit
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",  # 256 MiB
+    "PRAGMA cache_size=-16384",  # 16 MiB per connection
+)
+
+# Upserts rather than INSERT OR REPLACE, which deletes the old row and with it
+# the ban flag, join date and play counters
+UPSERT_USER_SQL = """
+    INSERT INTO users (user_id, username, first_name, last_name, last_activity)
+    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(user_id) DO UPDATE SET
+        username = excluded.username,
+        first_name = excluded.first_name,
+        last_name = excluded.last_name,
+        last_activity = CURRENT_TIMESTAMP
+"""
+
+UPSERT_CHAT_SQL = """
+    INSERT INTO chats (chat_id, chat_title, chat_type, last_activity)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(chat_id) DO UPDATE SET
+        chat_title = excluded.chat_title,
+        chat_type = excluded.chat_type,
+        last_activity = CURRENT_TIMESTAMP
+"""
+
+# Full schema, run as one script in a single transaction at startup
+SCHEMA_SQL = """
+    -- WAL lets readers on other pooled connections run alongside a writer
+    PRAGMA journal_mode=WAL;
+
+    BEGIN;
+
+    -- Users table
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        is_banned BOOLEAN DEFAULT FALSE,
+        join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        total_songs_played INTEGER DEFAULT 0
+    );
+
+    -- Chats table
+    CREATE TABLE IF NOT EXISTS chats (
+        chat_id INTEGER PRIMARY KEY,
+        chat_title TEXT,
+        chat_type TEXT DEFAULT 'group',
+        is_active BOOLEAN DEFAULT TRUE,
+        join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        total_songs_played INTEGER DEFAULT 0
+    );
+
+    -- Songs history table
+    CREATE TABLE IF NOT EXISTS song_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER,
+        user_id INTEGER,
+        song_title TEXT,
+        song_url TEXT,
+        song_duration INTEGER,
+        played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (chat_id) REFERENCES chats (chat_id),
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    );
+
+    -- Playlists table
+    CREATE TABLE IF NOT EXISTS playlists (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        playlist_name TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_public BOOLEAN DEFAULT FALSE,
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    );
+
+    -- Playlist songs table
+    CREATE TABLE IF NOT EXISTS playlist_songs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        playlist_id INTEGER,
+        song_title TEXT,
+        song_url TEXT,
+        song_duration INTEGER,
+        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (playlist_id) REFERENCES playlists (id)
+    );
+
+    -- Bot statistics table
+    CREATE TABLE IF NOT EXISTS bot_stats (
+        id INTEGER PRIMARY KEY,
+        total_users INTEGER DEFAULT 0,
+        total_chats INTEGER DEFAULT 0,
+        total_songs_played INTEGER DEFAULT 0,
+        bot_start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Indexes for the history, leaderboard and playlist lookups
+    CREATE INDEX IF NOT EXISTS idx_history_chat_played
+        ON song_history (chat_id, played_at);
+    CREATE INDEX IF NOT EXISTS idx_history_song
+        ON song_history (song_title, song_url);
+    CREATE INDEX IF NOT EXISTS idx_users_songs
+        ON users (total_songs_played);
+    CREATE INDEX IF NOT EXISTS idx_chats_active_songs
+        ON chats (total_songs_played) WHERE is_active = TRUE;
+    CREATE INDEX IF NOT EXISTS idx_playlists_user
+        ON playlists (user_id);
+    CREATE INDEX IF NOT EXISTS idx_playlist_songs_playlist
+        ON playlist_songs (playlist_id);
+
+    -- Keep the leaderboard counters in step with history inside the INSERT's own transaction
+    -- (bot_stats.total_songs_played isn't bumped: get_bot_stats recounts it from song_history)
+    CREATE TRIGGER IF NOT EXISTS trg_song_history_counts
+    AFTER INSERT ON song_history
+    BEGIN
+        UPDATE users SET total_songs_played = total_songs_played + 1,
+        last_activity = CURRENT_TIMESTAMP WHERE user_id = NEW.user_id;
+        UPDATE chats SET total_songs_played = total_songs_played + 1,
+        last_activity = CURRENT_TIMESTAMP WHERE chat_id = NEW.chat_id;
+    END;
+
+    -- Full-text index over history titles for search_songs_history
+    CREATE VIRTUAL TABLE IF NOT EXISTS song_fts USING fts5(
+        song_title, content='song_history', content_rowid='id', tokenize='unicode61'
+    );
+    CREATE TRIGGER IF NOT EXISTS trg_song_fts_insert
+    AFTER INSERT ON song_history
+    BEGIN
+        INSERT INTO song_fts (rowid, song_title) VALUES (NEW.id, NEW.song_title);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_song_fts_delete
+    AFTER DELETE ON song_history
+    BEGIN
+        INSERT INTO song_fts (song_fts, rowid, song_title) VALUES ('delete', OLD.id, OLD.song_title);
+    END;
+
+    -- Insert initial stats if not exists
+    INSERT OR IGNORE INTO bot_stats (id, bot_start_time)
+    VALUES (1, CURRENT_TIMESTAMP);
+
+    COMMIT;
+"""
+
 class Database:
     def __init__(self):
         self.db_path = "musicbot.db"
+        self._connections: List[aiosqlite.Connection] = []
+        self._pool: asyncio.Queue = asyncio.Queue()
+        
+        # Banned user IDs, loaded at startup and kept in step by ban/unban
+        self._banned_users: Set[int] = set()
         
+    async def _open_pool(self):
+        """Open the pooled connections"""
+        for _ in range(DB_POOL_SIZE):
+            # Queries are fixed strings, so each connection's statement cache keeps them prepared
+            db = await aiosqlite.connect(self.db_path, cached_statements=DB_STATEMENT_CACHE_SIZE)
+            for pragma in CONNECTION_PRAGMAS:
+                await db.execute(pragma)
+            self._connections.append(db)
+            self._pool.put_nowait(db)
+            
+    @asynccontextmanager
+    async def _connection(self):
+        """Borrow a pooled connection, rolling back anything left uncommitted"""
+        db = await self._pool.get()
+        try:
+            yield db
+        finally:
+            try:
+                if db.in_transaction:
+                    await db.rollback()
+            finally:
+                self._pool.put_nowait(db)
+                
     async def initialize(self):
         """Initialize database and create tables"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Users table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    is_banned BOOLEAN DEFAULT FALSE,
-                    join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    total_songs_played INTEGER DEFAULT 0
-                )
-            """)
-            
-            # Chats table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS chats (
-                    chat_id INTEGER PRIMARY KEY,
-                    chat_title TEXT,
-                    chat_type TEXT DEFAULT 'group',
-                    is_active BOOLEAN DEFAULT TRUE,
-                    join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    total_songs_played INTEGER DEFAULT 0
-                )
-            """)
-            
-            # Songs history table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS song_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    chat_id INTEGER,
-                    user_id INTEGER,
-                    song_title TEXT,
-                    song_url TEXT,
-                    song_duration INTEGER,
-                    played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (chat_id) REFERENCES chats (chat_id),
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            """)
-            
-            # Playlists table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS playlists (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    playlist_name TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_public BOOLEAN DEFAULT FALSE,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            """)
+        await self._open_pool()
+        
+        async with self._connection() as db:
+            cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE name = 'song_fts'")
+            has_fts = await cursor.fetchone() is not None
+            await cursor.close()
             
-            # Playlist songs table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS playlist_songs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    playlist_id INTEGER,
-                    song_title TEXT,
-                    song_url TEXT,
-                    song_duration INTEGER,
-                    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (playlist_id) REFERENCES playlists (id)
-                )
-            """)
+            # Tables, indexes and the stats row in one script and one transaction
+            await db.executescript(SCHEMA_SQL)
             
-            # Bot statistics table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS bot_stats (
-                    id INTEGER PRIMARY KEY,
-                    total_users INTEGER DEFAULT 0,
-                    total_chats INTEGER DEFAULT 0,
-                    total_songs_played INTEGER DEFAULT 0,
-                    bot_start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+            if not has_fts:
+                # Index history recorded before the search table existed
+                await db.execute("INSERT INTO song_fts (song_fts) VALUES ('rebuild')")
+                await db.commit()
             
-            # Insert initial stats if not exists
-            await db.execute("""
-                INSERT OR IGNORE INTO bot_stats (id, bot_start_time) 
-                VALUES (1, CURRENT_TIMESTAMP)
-            """)
-            
-            await db.commit()
+            cursor = await db.execute("SELECT user_id FROM users WHERE is_banned = TRUE")
+            self._banned_users = {row[0] for row in await cursor.fetchall()}
             
         logger.info("Database initialized successfully")
         
     async def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
         """Add or update user in database"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT OR REPLACE INTO users 
-                (user_id, username, first_name, last_name, last_activity)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-            """, (user_id, username, first_name, last_name))
+        async with self._connection() as db:
+            await db.execute(UPSERT_USER_SQL, (user_id, username, first_name, last_name))
             await db.commit()
             
     async def add_chat(self, chat_id: int, chat_title: str = None, chat_type: str = "group"):
         """Add or update chat in database"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT OR REPLACE INTO chats 
-                (chat_id, chat_title, chat_type, last_activity)
-                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-            """, (chat_id, chat_title, chat_type))
+        async with self._connection() as db:
+            await db.execute(UPSERT_CHAT_SQL, (chat_id, chat_title, chat_type))
+            await db.commit()
+            
+    async def add_user_and_chat(self, user_id: int, username: str = None, first_name: str = None,
+                                chat_id: int = None, chat_title: str = None, chat_type: str = "group"):
+        """Upsert a user and their chat in a single transaction"""
+        async with self._connection() as db:
+            await db.execute(UPSERT_USER_SQL, (user_id, username, first_name, None))
+            await db.execute(UPSERT_CHAT_SQL, (chat_id, chat_title, chat_type))
             await db.commit()
             
     async def is_user_banned(self, user_id: int) -> bool:
         """Check if user is banned"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "SELECT is_banned FROM users WHERE user_id = ?", (user_id,)
-            )
-            result = await cursor.fetchone()
-            return result and result[0]
+        # Answered from memory, this runs before nearly every command
+        return user_id in self._banned_users
             
     async def ban_user(self, user_id: int):
         """Ban a user"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
+        async with self._connection() as db:
+            cursor = await db.execute(
                 "UPDATE users SET is_banned = TRUE WHERE user_id = ?", (user_id,)
             )
             await db.commit()
+        if cursor.rowcount:
+            self._banned_users.add(user_id)
             
     async def unban_user(self, user_id: int):
         """Unban a user"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             await db.execute(
                 "UPDATE users SET is_banned = FALSE WHERE user_id = ?", (user_id,)
             )
             await db.commit()
+        self._banned_users.discard(user_id)
             
     async def add_song_to_history(self, chat_id: int, user_id: int, song_title: str, song_url: str, duration: int):
         """Add song to play history"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
+            # The per-user and per-chat counters are bumped by trg_song_history_counts
             await db.execute("""
                 INSERT INTO song_history 
                 (chat_id, user_id, song_title, song_url, song_duration)
                 VALUES (?, ?, ?, ?, ?)
             """, (chat_id, user_id, song_title, song_url, duration))
             
-            # Update user stats
-            await db.execute("""
-                UPDATE users SET total_songs_played = total_songs_played + 1,
-                last_activity = CURRENT_TIMESTAMP WHERE user_id = ?
-            """, (user_id,))
-            
-            # Update chat stats
-            await db.execute("""
-                UPDATE chats SET total_songs_played = total_songs_played + 1,
-                last_activity = CURRENT_TIMESTAMP WHERE chat_id = ?
-            """, (chat_id,))
-            
-            # Update bot stats
-            await db.execute("""
-                UPDATE bot_stats SET total_songs_played = total_songs_played + 1,
-                last_updated = CURRENT_TIMESTAMP WHERE id = 1
-            """)
-            
             await db.commit()
             
     async def get_user_stats(self, user_id: int) -> Optional[Dict]:
         """Get user statistics"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
                 SELECT username, first_name, total_songs_played, join_date, last_activity
                 FROM users WHERE user_id = ?
@@ -203,7 +304,7 @@ class Database:
             
     async def get_chat_stats(self, chat_id: int) -> Optional[Dict]:
         """Get chat statistics"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
                 SELECT chat_title, total_songs_played, join_date, last_activity
                 FROM chats WHERE chat_id = ?
@@ -221,7 +322,7 @@ class Database:
             
     async def get_bot_stats(self) -> Dict:
         """Get bot statistics"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             # Get bot stats
             cursor = await db.execute("""
                 SELECT total_users, total_chats, total_songs_played, bot_start_time
@@ -256,7 +357,7 @@ class Database:
             
     async def get_top_users(self, limit: int = 10) -> List[Dict]:
         """Get top users by songs played"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
                 SELECT user_id, username, first_name, total_songs_played
                 FROM users ORDER BY total_songs_played DESC LIMIT ?
@@ -275,7 +376,7 @@ class Database:
             
     async def get_top_chats(self, limit: int = 10) -> List[Dict]:
         """Get top chats by songs played"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
                 SELECT chat_id, chat_title, total_songs_played
                 FROM chats WHERE is_active = TRUE 
@@ -294,7 +395,7 @@ class Database:
             
     async def get_recent_songs(self, chat_id: int, limit: int = 10) -> List[Dict]:
         """Get recently played songs in a chat"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
                 SELECT s.song_title, s.song_url, s.played_at, u.username, u.first_name
                 FROM song_history s
@@ -317,7 +418,7 @@ class Database:
             
     async def create_playlist(self, user_id: int, playlist_name: str, is_public: bool = False) -> int:
         """Create a new playlist"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
                 INSERT INTO playlists (user_id, playlist_name, is_public)
                 VALUES (?, ?, ?)
@@ -327,7 +428,7 @@ class Database:
             
     async def add_song_to_playlist(self, playlist_id: int, song_title: str, song_url: str, duration: int):
         """Add song to playlist"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             await db.execute("""
                 INSERT INTO playlist_songs (playlist_id, song_title, song_url, song_duration)
                 VALUES (?, ?, ?, ?)
@@ -336,12 +437,15 @@ class Database:
             
     async def get_user_playlists(self, user_id: int) -> List[Dict]:
         """Get user's playlists"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
-                SELECT id, playlist_name, created_at, is_public,
-                       (SELECT COUNT(*) FROM playlist_songs WHERE playlist_id = p.id) as song_count
-                FROM playlists p WHERE user_id = ?
-                ORDER BY created_at DESC
+                SELECT p.id, p.playlist_name, p.created_at, p.is_public,
+                       COUNT(ps.id) as song_count
+                FROM playlists p
+                LEFT JOIN playlist_songs ps ON ps.playlist_id = p.id
+                WHERE p.user_id = ?
+                GROUP BY p.id
+                ORDER BY p.created_at DESC
             """, (user_id,))
             results = await cursor.fetchall()
             
@@ -358,7 +462,7 @@ class Database:
             
     async def get_playlist_songs(self, playlist_id: int) -> List[Dict]:
         """Get songs in a playlist"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
                 SELECT song_title, song_url, song_duration, added_at
                 FROM playlist_songs WHERE playlist_id = ?
@@ -378,7 +482,7 @@ class Database:
             
     async def delete_playlist(self, playlist_id: int, user_id: int) -> bool:
         """Delete a playlist"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             # Check if playlist belongs to user
             cursor = await db.execute(
                 "SELECT user_id FROM playlists WHERE id = ?", (playlist_id,)
@@ -395,16 +499,32 @@ class Database:
             await db.commit()
             return True
             
-    async def get_all_users(self) -> List[int]:
-        """Get all user IDs for broadcasting"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute("SELECT user_id FROM users WHERE is_banned = FALSE")
-            results = await cursor.fetchall()
-            return [result[0] for result in results]
+    async def count_broadcast_users(self) -> int:
+        """Count the users a broadcast goes to"""
+        async with self._connection() as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM users WHERE is_banned = FALSE")
+            return (await cursor.fetchone())[0]
+            
+    async def iter_all_users(self, batch: int = USER_BATCH_SIZE) -> AsyncIterator[List[int]]:
+        """Yield user IDs for broadcasting, a batch at a time"""
+        last_id = None
+        while True:
+            # Keyset pages, so no connection or read snapshot is held while the caller sends
+            async with self._connection() as db:
+                cursor = await db.execute("""
+                    SELECT user_id FROM users
+                    WHERE is_banned = FALSE AND (? IS NULL OR user_id > ?)
+                    ORDER BY user_id LIMIT ?
+                """, (last_id, last_id, batch))
+                rows = await cursor.fetchall()
+            if not rows:
+                return
+            yield [row[0] for row in rows]
+            last_id = rows[-1][0]
             
     async def get_popular_songs(self, limit: int = 10) -> List[Dict]:
         """Get most played songs"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
                 SELECT song_title, song_url, COUNT(*) as play_count
                 FROM song_history
@@ -425,16 +545,24 @@ class Database:
             
     async def search_songs_history(self, query: str, limit: int = 10) -> List[Dict]:
         """Search in song history"""
-        async with aiosqlite.connect(self.db_path) as db:
+        words = query.split()
+        if not words:
+            return []
+            
+        # Every word must match the start of a title token; quoting keeps FTS syntax out
+        match = " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+        
+        async with self._connection() as db:
             cursor = await db.execute("""
-                SELECT DISTINCT s.song_title, s.song_url, s.song_duration,
+                SELECT s.song_title, s.song_url, s.song_duration,
                        COUNT(*) as play_count
-                FROM song_history s
-                WHERE s.song_title LIKE ?
+                FROM song_fts f
+                JOIN song_history s ON s.id = f.rowid
+                WHERE song_fts MATCH ?
                 GROUP BY s.song_title, s.song_url
                 ORDER BY play_count DESC
                 LIMIT ?
-            """, (f"%{query}%", limit))
+            """, (match, limit))
             results = await cursor.fetchall()
             
             return [
@@ -449,22 +577,34 @@ class Database:
             
     async def cleanup_old_history(self, days: int = 30):
         """Clean up old song history"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             await db.execute("""
                 DELETE FROM song_history 
-                WHERE played_at < datetime('now', '-{} days')
-            """.format(days))
+                WHERE played_at < datetime('now', ?)
+            """, (f"-{int(days)} days",))
             await db.commit()
             
     async def deactivate_chat(self, chat_id: int):
         """Mark chat as inactive"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             await db.execute(
                 "UPDATE chats SET is_active = FALSE WHERE chat_id = ?", (chat_id,)
             )
             await db.commit()
             
+    async def optimize(self):
+        """Refresh query planner statistics where SQLite thinks they're stale"""
+        async with self._connection() as db:
+            await db.execute("PRAGMA optimize")
+            
     async def close(self):
-        """Close database connection"""
-        # SQLite connections are closed automatically with aiosqlite
-        pass
\ No newline at end of file
+        """Close pooled database connections"""
+        connections, self._connections = self._connections, []
+        self._pool = asyncio.Queue()
+        for db in connections:
+            try:
+                # Each connection records which queries would benefit from ANALYZE
+                await db.execute("PRAGMA optimize")
+            except Exception as e:
+                logger.warning(f"PRAGMA optimize failed on close: {e}")
+            await db.close()
\ No newline at end of file
@@ -4,48 +4,138 @@ Decorators for bot functionality
 
 import asyncio
 import logging
-import os
+import math
+from collections import OrderedDict
 from functools import wraps
-from typing import Dict, List
-from datetime import datetime, timedelta
-from telegram import Update
+from time import monotonic
+from typing import Optional, Tuple
+from datetime import datetime
+from telegram import Bot, LinkPreviewOptions, Update
+from telegram.error import RetryAfter
 from telegram.ext import ContextTypes
 from config import Config
+from utils.tasks import spawn
+from utils.telegram_egress import outbound_bucket
 
 logger = logging.getLogger(__name__)
 
-# Rate limiting storage
-rate_limit_storage: Dict[int, List[datetime]] = {}
+# Users whose rate limit state is kept; the least recently seen are dropped first
+# (a dropped user just starts again with a full bucket)
+RATE_LIMIT_MAX_USERS = 10000
+
+# Rate limiting storage: token bucket per user as (tokens left, monotonic time of last refill)
+rate_limit_storage: "OrderedDict[int, Tuple[float, float]]" = OrderedDict()
+
+# Command log entries waiting for the log channel, and how many go out per message
+CHANNEL_LOG_QUEUE_SIZE = 1000
+CHANNEL_LOG_BATCH_SIZE = 10
+
+# Created with its consumer task on the first channel_log entry
+_channel_log_queue: Optional[asyncio.Queue] = None
+
+# Replies shared by the decorators and handler(), built once
+RATE_LIMIT_MESSAGE = (
+    "🚫 **Rate limit exceeded!**\n"
+    "Please wait {wait} seconds before making another request."
+)
+ACCESS_DENIED_MESSAGE = (
+    "🚫 **Access Denied!**\n"
+    "This command is only available to bot administrators."
+)
+BANNED_MESSAGE = (
+    "🚫 **You are banned from using this bot!**\n"
+    "Contact bot administrator if you think this is an error."
+)
+GROUP_ONLY_MESSAGE = "❌ This command can only be used in groups with voice chats!"
+ERROR_MESSAGE = (
+    "❌ **An error occurred while processing your request.**\n"
+    "Please try again later or contact the administrator."
+)
+PREMIUM_MESSAGE = (
+    "💎 **Premium Feature**\n"
+    "This feature is only available to premium users.\n"
+    "Contact bot administrator for more information."
+)
+MAINTENANCE_MESSAGE = (
+    "🔧 **Bot is under maintenance**\n"
+    "Please try again later. We'll be back soon!"
+)
+
+# None of the replies link anywhere, so Telegram needn't look for a preview
+_NO_LINK_PREVIEW = LinkPreviewOptions(is_disabled=True)
+
+def _take_token(user_id: int) -> int:
+    """Spend one of the user's rate limit tokens, returning 0 or the seconds to wait"""
+    current_time = monotonic()
+    capacity = Config.RATE_LIMIT_REQUESTS
+    
+    # Refill at RATE_LIMIT_REQUESTS per RATE_LIMIT_WINDOW, never past a full bucket
+    tokens, last_refill = rate_limit_storage.get(user_id, (capacity, current_time))
+    tokens = min(capacity, tokens + (current_time - last_refill) * capacity / Config.RATE_LIMIT_WINDOW)
+    
+    # Check rate limit, spending a token on this request if there is one
+    wait = 0
+    if tokens < 1:
+        wait = math.ceil((1 - tokens) * Config.RATE_LIMIT_WINDOW / capacity)
+    else:
+        tokens -= 1
+        
+    rate_limit_storage[user_id] = (tokens, current_time)
+    rate_limit_storage.move_to_end(user_id)
+    if len(rate_limit_storage) > RATE_LIMIT_MAX_USERS:
+        rate_limit_storage.popitem(last=False)
+    return wait
+
+async def safe_reply(message, text: str, **kwargs):
+    """Reply under the bot-wide outbound rate shared with the egress, waiting out flood control once"""
+    # A flood of rejected commands draws on the same budget as every other send
+    await outbound_bucket().acquire()
+    kwargs.setdefault('link_preview_options', _NO_LINK_PREVIEW)
+    try:
+        return await message.reply_text(text, **kwargs)
+    except RetryAfter as e:
+        await asyncio.sleep(e.retry_after)
+        return await message.reply_text(text, **kwargs)
+
+def _command_name(update: Update) -> str:
+    """First word of the message, without splitting the rest of it"""
+    text = update.message.text if update.message else None
+    return text.split(None, 1)[0] if text and not text.isspace() else "unknown"
+
+def handler(rate: bool = False, admin: bool = False, banned_check: bool = True):
+    """Run the selected guards inline in one wrapper instead of stacking decorators"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+            user_id = update.effective_user.id
+            
+            if rate:
+                wait = _take_token(user_id)
+                if wait:
+                    await safe_reply(update.message, RATE_LIMIT_MESSAGE.format(wait=wait), parse_mode='Markdown')
+                    return
+                    
+            if banned_check and hasattr(self, 'db') and await self.db.is_user_banned(user_id):
+                await safe_reply(update.message, BANNED_MESSAGE, parse_mode='Markdown')
+                return
+                
+            if admin and user_id not in Config.SUDO_USERS:
+                await safe_reply(update.message, ACCESS_DENIED_MESSAGE, parse_mode='Markdown')
+                return
+                
+            return await func(self, update, context, *args, **kwargs)
+        return wrapper
+    return decorator
 
 def rate_limit(func):
     """Rate limiting decorator"""
     @wraps(func)
     async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
-        user_id = update.effective_user.id
-        current_time = datetime.now()
-        
-        # Initialize user's request history
-        if user_id not in rate_limit_storage:
-            rate_limit_storage[user_id] = []
-            
-        # Clean old requests
-        rate_limit_storage[user_id] = [
-            request_time for request_time in rate_limit_storage[user_id]
-            if current_time - request_time < timedelta(seconds=Config.RATE_LIMIT_WINDOW)
-        ]
-        
-        # Check rate limit
-        if len(rate_limit_storage[user_id]) >= Config.RATE_LIMIT_REQUESTS:
-            await update.message.reply_text(
-                f"🚫 **Rate limit exceeded!**\n"
-                f"Please wait {Config.RATE_LIMIT_WINDOW} seconds before making another request.",
-                parse_mode='Markdown'
-            )
+        wait = _take_token(update.effective_user.id)
+        if wait:
+            await safe_reply(update.message, RATE_LIMIT_MESSAGE.format(wait=wait), parse_mode='Markdown')
             return
             
-        # Add current request
-        rate_limit_storage[user_id].append(current_time)
-        
         # Execute function
         return await func(self, update, context, *args, **kwargs)
     return wrapper
@@ -57,11 +147,7 @@ def admin_only(func):
         user_id = update.effective_user.id
         
         if user_id not in Config.SUDO_USERS:
-            await update.message.reply_text(
-                "🚫 **Access Denied!**\n"
-                "This command is only available to bot administrators.",
-                parse_mode='Markdown'
-            )
+            await safe_reply(update.message, ACCESS_DENIED_MESSAGE, parse_mode='Markdown')
             return
             
         return await func(self, update, context, *args, **kwargs)
@@ -75,11 +161,7 @@ def is_user_banned(func):
         
         # Check if user is banned
         if hasattr(self, 'db') and await self.db.is_user_banned(user_id):
-            await update.message.reply_text(
-                "🚫 **You are banned from using this bot!**\n"
-                "Contact bot administrator if you think this is an error.",
-                parse_mode='Markdown'
-            )
+            await safe_reply(update.message, BANNED_MESSAGE, parse_mode='Markdown')
             return
             
         return await func(self, update, context, *args, **kwargs)
@@ -91,7 +173,7 @@ def log_command(func):
     async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         user = update.effective_user
         chat = update.effective_chat
-        command = update.message.text.split()[0] if update.message and update.message.text else "unknown"
+        command = _command_name(update)
         
         logger.info(
             f"Command used: {command} by {user.first_name} ({user.id}) "
@@ -109,10 +191,7 @@ def voice_chat_only(func):
         
         # Check if it's a group/supergroup
         if update.effective_chat.type not in ['group', 'supergroup']:
-            await update.message.reply_text(
-                "❌ This command can only be used in groups with voice chats!",
-                parse_mode='Markdown'
-            )
+            await safe_reply(update.message, GROUP_ONLY_MESSAGE, parse_mode='Markdown')
             return
             
         return await func(self, update, context, *args, **kwargs)
@@ -127,11 +206,7 @@ def error_handler(func):
         except Exception as e:
             logger.error(f"Error in {func.__name__}: {e}")
             try:
-                await update.message.reply_text(
-                    "❌ **An error occurred while processing your request.**\n"
-                    "Please try again later or contact the administrator.",
-                    parse_mode='Markdown'
-                )
+                await safe_reply(update.message, ERROR_MESSAGE, parse_mode='Markdown')
             except Exception as reply_error:
                 logger.error(f"Failed to send error message: {reply_error}")
     return wrapper
@@ -140,26 +215,42 @@ def typing_action(func):
     """Send typing action decorator"""
     @wraps(func)
     async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
-        chat_id = update.effective_chat.id
+        # Fire and forget: the indicator needs no reply, and cancelling it could drop it unsent
+        spawn(context.bot.send_chat_action(update.effective_chat.id, "typing"))
         
-        # Send typing action
-        typing_task = asyncio.create_task(
-            context.bot.send_chat_action(chat_id, "typing")
-        )
+        return await func(self, update, context, *args, **kwargs)
+    return wrapper
+
+def _queue_channel_log(bot: Bot, entry: str):
+    """Queue an entry for the log channel, starting the consumer on first use"""
+    global _channel_log_queue
+    if _channel_log_queue is None:
+        _channel_log_queue = asyncio.Queue(maxsize=CHANNEL_LOG_QUEUE_SIZE)
+        spawn(_channel_log_consumer(bot, _channel_log_queue))
+    try:
+        _channel_log_queue.put_nowait(entry)
+    except asyncio.QueueFull:
+        logger.warning("Channel log queue full, dropping entry")
+
+async def _channel_log_consumer(bot: Bot, queue: asyncio.Queue):
+    """Send queued log entries to the log channel, several per message"""
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < CHANNEL_LOG_BATCH_SIZE and not queue.empty():
+            batch.append(queue.get_nowait())
+        text = "\n\n".join(batch)
         
         try:
-            # Execute function
-            result = await func(self, update, context, *args, **kwargs)
-            return result
-        finally:
-            # Cancel typing action
-            typing_task.cancel()
+            await bot.send_message(chat_id=Config.LOG_CHANNEL_ID, text=text, parse_mode='Markdown')
+        except RetryAfter as e:
+            # Flood control: wait it out, then try this batch once more
+            await asyncio.sleep(e.retry_after)
             try:
-                await typing_task
-            except asyncio.CancelledError:
-                pass
-                
-    return wrapper
+                await bot.send_message(chat_id=Config.LOG_CHANNEL_ID, text=text, parse_mode='Markdown')
+            except Exception as e:
+                logger.warning(f"Failed to log to channel: {e}")
+        except Exception as e:
+            logger.warning(f"Failed to log to channel: {e}")
 
 def channel_log(func):
     """Log to channel decorator"""
@@ -168,13 +259,12 @@ def channel_log(func):
         # Execute function first
         result = await func(self, update, context, *args, **kwargs)
         
-        # Log to channel if configured
-        log_channel = os.getenv('LOG_CHANNEL_ID')
-        if log_channel:
+        # Log to channel if configured (sent in the background, batched with other entries)
+        if Config.LOG_CHANNEL_ID:
             try:
                 user = update.effective_user
                 chat = update.effective_chat
-                command = update.message.text.split()[0] if update.message and update.message.text else "unknown"
+                command = _command_name(update)
                 
                 log_message = (
                     f"📊 **Command Log**\n"
@@ -184,13 +274,9 @@ def channel_log(func):
                     f"**Time:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
                 )
                 
-                await context.bot.send_message(
-                    chat_id=int(log_channel),
-                    text=log_message,
-                    parse_mode='Markdown'
-                )
+                _queue_channel_log(context.bot, log_message)
             except Exception as e:
-                logger.warning(f"Failed to log to channel: {e}")
+                logger.warning(f"Failed to queue channel log: {e}")
                 
         return result
     return wrapper
@@ -203,12 +289,7 @@ def premium_only(func):
         
         # For now, treat admins as premium users
         if user_id not in Config.SUDO_USERS:
-            await update.message.reply_text(
-                "💎 **Premium Feature**\n"
-                "This feature is only available to premium users.\n"
-                "Contact bot administrator for more information.",
-                parse_mode='Markdown'
-            )
+            await safe_reply(update.message, PREMIUM_MESSAGE, parse_mode='Markdown')
             return
             
         return await func(self, update, context, *args, **kwargs)
@@ -218,15 +299,8 @@ def maintenance_mode(func):
     """Maintenance mode decorator"""
     @wraps(func)
     async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
-        maintenance = os.getenv('MAINTENANCE_MODE', 'false').lower() == 'true'
-        user_id = update.effective_user.id
-        
-        if maintenance and user_id not in Config.SUDO_USERS:
-            await update.message.reply_text(
-                "🔧 **Bot is under maintenance**\n"
-                "Please try again later. We'll be back soon!",
-                parse_mode='Markdown'
-            )
+        if Config.MAINTENANCE_MODE and update.effective_user.id not in Config.SUDO_USERS:
+            await safe_reply(update.message, MAINTENANCE_MESSAGE, parse_mode='Markdown')
             return
             
         return await func(self, update, context, *args, **kwargs)
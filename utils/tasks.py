@@ -0,0 +1,25 @@
+"""
+Background task helpers
+"""
+
+import asyncio
+import logging
+from typing import Coroutine, Set
+
+logger = logging.getLogger(__name__)
+
+# Strong references to fire-and-forget tasks until they finish
+_background_tasks: Set[asyncio.Task] = set()
+
+def _on_task_done(task: asyncio.Task):
+    """Drop the finished task and log its exception, if any"""
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.warning("Background task failed: %s", task.exception())
+
+def spawn(coro: Coroutine) -> asyncio.Task:
+    """Run a coroutine in the background without awaiting it"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_task_done)
+    return task
@@ -0,0 +1,164 @@
+"""
+Telegram Egress - Paces outgoing bot API calls and coalesces message edits
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+from telegram import Bot, InlineKeyboardMarkup
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows roughly 30 messages per second per bot
+DEFAULT_RATE = 30
+DEFAULT_WORKERS = 30
+DEFAULT_QUEUE_SIZE = 1000
+
+# Edits to the same message within this many seconds go out as one
+# (Telegram allows about one message per second per chat)
+DEFAULT_EDIT_DEBOUNCE = 1.0
+
+@dataclass
+class SendMessage:
+    """Queued send_message call"""
+    chat_id: int
+    text: str
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class EditMessage:
+    """Queued message edit, replacing the text as well when one is given"""
+    chat_id: int
+    message_id: int
+    reply_markup: Optional[InlineKeyboardMarkup]
+    text: Optional[str] = None
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+class TokenBucket:
+    """Simple token bucket refilled at a fixed rate"""
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()  # Hands out tokens in request order
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# Shared by every outbound sender so together they stay under Telegram's limit
+_outbound_bucket: Optional[TokenBucket] = None
+
+def outbound_bucket() -> TokenBucket:
+    """The process-wide bucket for bot API calls, created on first use"""
+    global _outbound_bucket
+    if _outbound_bucket is None:
+        _outbound_bucket = TokenBucket(DEFAULT_RATE, DEFAULT_RATE)
+    return _outbound_bucket
+
+class TelegramEgress:
+    def __init__(self, bot: Bot, bucket: Optional[TokenBucket] = None, workers: int = DEFAULT_WORKERS,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, edit_debounce: float = DEFAULT_EDIT_DEBOUNCE):
+        self.bot = bot
+        self._edit_debounce = edit_debounce
+        self._bucket = bucket or outbound_bucket()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._worker_count = workers
+        self._workers: List[asyncio.Task] = []
+
+        # (chat_id, message_id) -> latest edit not yet sent
+        self._pending_edits: Dict[Tuple[int, int], EditMessage] = {}
+        
+        # Edits waiting out their debounce window before being queued
+        self._delayed: Set[asyncio.Task] = set()
+
+    def start(self):
+        """Start the worker tasks (must be called from the running loop)"""
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self._worker_count)]
+
+    async def stop(self):
+        """Stop the worker tasks, dropping anything still queued"""
+        tasks = self._workers + list(self._delayed)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+
+    async def enqueue(self, request):
+        """Queue a SendMessage or EditMessage request"""
+        if isinstance(request, EditMessage):
+            key = (request.chat_id, request.message_id)
+            if key in self._pending_edits:
+                # An older edit for this message hasn't gone out yet, replace it
+                self._pending_edits[key] = request
+                return
+            self._pending_edits[key] = request
+            if self._edit_debounce > 0:
+                task = asyncio.create_task(self._enqueue_later(key))
+                self._delayed.add(task)
+                task.add_done_callback(self._delayed.discard)
+            else:
+                await self._queue.put(key)
+        else:
+            await self._queue.put(request)
+            
+    async def _enqueue_later(self, key: Tuple[int, int]):
+        """Queue a pending edit once its debounce window has passed"""
+        await asyncio.sleep(self._edit_debounce)
+        await self._queue.put(key)
+
+    async def _worker(self):
+        """Send queued requests, respecting the rate limit"""
+        while True:
+            item = await self._queue.get()
+            try:
+                if isinstance(item, tuple):
+                    item = self._pending_edits.pop(item)
+                await self._deliver(item)
+            except Exception as e:
+                logger.warning("Failed to send queued Telegram request: %s", e)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, request):
+        """Send a request, waiting out flood control once instead of dropping it"""
+        await self._bucket.acquire()
+        try:
+            await self._send(request)
+        except RetryAfter as e:
+            logger.warning("Flood control on queued Telegram request, retrying in %ss", e.retry_after)
+            await asyncio.sleep(e.retry_after)
+            await self._bucket.acquire()
+            await self._send(request)
+
+    async def _send(self, request):
+        """Perform the API call for a queued request"""
+        if isinstance(request, EditMessage) and request.text is not None:
+            await self.bot.edit_message_text(
+                request.text,
+                chat_id=request.chat_id,
+                message_id=request.message_id,
+                reply_markup=request.reply_markup,
+                **request.kwargs
+            )
+        elif isinstance(request, EditMessage):
+            await self.bot.edit_message_reply_markup(
+                chat_id=request.chat_id,
+                message_id=request.message_id,
+                reply_markup=request.reply_markup
+            )
+        else:
+            await self.bot.send_message(request.chat_id, request.text, **request.kwargs)
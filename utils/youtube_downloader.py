@@ -5,74 +5,198 @@ YouTube Downloader - Handles music search and download
 import asyncio
 import logging
 import os
+import re
+import threading
+import time
 import yt_dlp
-from typing import Optional, Dict, List
-from youtubesearchpython import VideosSearch
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Max songs kept in the lyrics cache, and how long (seconds) lyrics are reused
+LYRICS_CACHE_SIZE = 512
+LYRICS_CACHE_TTL = 24 * 3600
+
+# Lyrics budget in UTF-16 code units, which is how Telegram counts message length
+LYRICS_MAX_LENGTH = 4000
+
+# Max resolved queries kept, and how long (seconds) a result is reused
+TRACK_CACHE_SIZE = 2000
+TRACK_CACHE_TTL = 6 * 3600
+
+# Downloads (and their ffmpeg conversions) allowed to run at once
+DOWNLOAD_CONCURRENCY = 4
+
+# Downloaded formats played as they are (pytgcalls decodes through ffmpeg), so no mp3 encode is needed
+NATIVE_AUDIO_EXTS = ('webm', 'm4a', 'opus')
+
+# ffmpeg mp3 encodes allowed to run at once, one per core
+ENCODE_CONCURRENCY = os.cpu_count() or 1
+
+# Arguments for converting a downloaded stream to mp3
+FFMPEG_MP3_ARGS = ('-vn', '-codec:a', 'libmp3lame', '-b:a', '192k', '-f', 'mp3')
+
+# Max videos whose track info is kept, so a repeat download skips yt-dlp entirely
+VIDEO_CACHE_SIZE = 1000
+
+# The 11 character video ID in watch, youtu.be, shorts and embed URLs
+_VIDEO_ID_RE = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/)([\w-]{11})')
+
+def _format_duration(seconds: int) -> str:
+    """Format seconds as MM:SS, or HH:MM:SS for an hour or more"""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+def _truncate_utf16(text: str, limit: int) -> Optional[str]:
+    """Cut text to at most limit UTF-16 code units, or return None if it already fits"""
+    encoded = text.encode('utf-16-le')
+    if len(encoded) <= limit * 2:
+        return None
+    # A surrogate pair split at the cut is dropped by the decoder
+    return encoded[:limit * 2].decode('utf-16-le', errors='ignore')
+
 class YouTubeDownloader:
     def __init__(self):
+        # Shared by metadata lookups and downloads: one audio stream is all we
+        # need, so skip the DASH/HLS manifests and playlist expansion
+        self.info_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'noplaylist': True,
+            'cachedir': Config.YTDLP_CACHE_PATH,
+            'extractor_args': {'youtube': {'skip': ['dash', 'hls']}},
+        }
+        
+        # Search results only: list the entries without resolving each video
+        self.search_opts = {
+            **self.info_opts,
+            'extract_flat': 'in_playlist',
+        }
+        
         self.ydl_opts = {
+            **self.info_opts,
             'format': 'bestaudio/best',
             'extractaudio': True,
             'audioformat': 'mp3',
-            'outtmpl': f'{Config.DOWNLOADS_PATH}/%(title)s.%(ext)s',
+            'outtmpl': f'{Config.DOWNLOADS_PATH}/%(id)s.%(ext)s',  # Content-addressed by video ID
             'restrictfilenames': True,
-            'no_warnings': True,
             'ignoreerrors': False,
             'logtostderr': False,
-            'quiet': True,
             'no_color': True,
             'extractflat': False,
             'writethumbnail': False,
             'writeinfojson': False,
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
+            # No FFmpegExtractAudio: _encode_mp3 converts outside the download slot
         }
         
         # Add cookies if available
         if Config.YOUTUBE_COOKIES_PATH and os.path.exists(Config.YOUTUBE_COOKIES_PATH):
             self.ydl_opts['cookiefile'] = Config.YOUTUBE_COOKIES_PATH
             
+        # YoutubeDL instances per executor thread, reused across calls
+        self._local = threading.local()
+            
+        # Genius API client, created on the first lyrics lookup
+        self._genius = None
+        
+        # Normalised song title -> (expiry, lyrics lookup), least recently used first
+        self._lyrics_cache: "OrderedDict[str, Tuple[float, asyncio.Future]]" = OrderedDict()
+        
+        # Query key (see _track_key) -> (expiry, track info), least recently used first
+        self._track_cache: "OrderedDict[Tuple[str, str], Tuple[float, Dict]]" = OrderedDict()
+        
+        # Video ID -> track info for a file in the downloads folder, least recently used first
+        self._video_cache: "OrderedDict[str, Dict]" = OrderedDict()
+        
+        # Query key -> search/download still in progress
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        
+        # Video ID (or URL) -> download still in progress, and the cap on parallel downloads
+        self._downloads: Dict[str, asyncio.Task] = {}
+        self._download_slots = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+        self._encode_slots = asyncio.Semaphore(ENCODE_CONCURRENCY)
+            
+    def _ydl(self, name: str, opts: Dict) -> yt_dlp.YoutubeDL:
+        """Get this thread's YoutubeDL for the given options, creating it on first use"""
+        ydl = getattr(self._local, name, None)
+        if ydl is None:
+            # Instances aren't thread-safe, but building one per call reloads every extractor
+            ydl = yt_dlp.YoutubeDL(opts)
+            setattr(self._local, name, ydl)
+        return ydl
+        
+    def _extract_info(self, url: str) -> Optional[Dict]:
+        """Fetch video metadata (runs in an executor thread)"""
+        return self._ydl('info', self.info_opts).extract_info(url, download=False)
+        
+    def _search(self, query: str, limit: int) -> Optional[Dict]:
+        """Run a YouTube search through yt-dlp (runs in an executor thread)"""
+        return self._ydl('search', self.search_opts).extract_info(f"ytsearch{limit}:{query}", download=False)
+        
+    def _extract_download_info(self, url: str) -> Optional[Dict]:
+        """Fetch video metadata with the audio format already picked (runs in an executor thread)"""
+        return self._ydl('download', self.ydl_opts).extract_info(url, download=False)
+        
+    def _download(self, info: Dict) -> Optional[str]:
+        """Download the audio stream, returning its file path (runs in an executor thread)"""
+        # Reuses the extracted info, so the page, player JS and formats aren't fetched again
+        info = self._ydl('download', self.ydl_opts).process_ie_result(info, download=True)
+        downloads = info.get('requested_downloads') if info else None
+        return downloads[-1].get('filepath') if downloads else None
+        
+    async def _encode_mp3(self, src_path: str, dst_path: str):
+        """Convert a downloaded stream to mp3 with ffmpeg, then remove the source"""
+        # Written under a temporary name so a half-encoded file is never mistaken for a cached one
+        tmp_path = dst_path + '.part'
+        async with self._encode_slots:
+            process = await asyncio.create_subprocess_exec(
+                'ffmpeg', '-y', '-loglevel', 'error', '-i', src_path, *FFMPEG_MP3_ARGS, tmp_path,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await process.communicate()
+            
+        try:
+            if process.returncode != 0:
+                raise Exception(f"ffmpeg failed: {stderr.decode(errors='replace').strip()}")
+            os.replace(tmp_path, dst_path)
+        finally:
+            for path in (src_path, tmp_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        
     async def search_youtube(self, query: str, limit: int = 1) -> List[Dict]:
         """Search YouTube for videos"""
         try:
-            search = VideosSearch(query, limit=limit)
-            results = await asyncio.get_event_loop().run_in_executor(
-                None, search.result
-            )
+            results = await asyncio.to_thread(self._search, query, limit)
             
             videos = []
-            for video in results['result']:
-                duration_str = video.get('duration', '0:00')
-                duration_parts = duration_str.split(':')
-                
-                # Convert duration to seconds
-                if len(duration_parts) == 2:
-                    duration_seconds = int(duration_parts[0]) * 60 + int(duration_parts[1])
-                elif len(duration_parts) == 3:
-                    duration_seconds = int(duration_parts[0]) * 3600 + int(duration_parts[1]) * 60 + int(duration_parts[2])
-                else:
-                    duration_seconds = 0
+            for video in (results or {}).get('entries') or ():
+                # Flat entries carry the duration in seconds (None for live streams)
+                duration_seconds = int(video.get('duration') or 0)
                     
                 # Check duration limit
                 if duration_seconds > Config.MAX_SONG_DURATION:
                     continue
                     
+                thumbnails = video.get('thumbnails')
+                view_count = video.get('view_count')
                 videos.append({
                     'id': video['id'],
-                    'title': video['title'],
-                    'duration': duration_str,
+                    'title': video.get('title'),
+                    'duration': _format_duration(duration_seconds),
                     'duration_seconds': duration_seconds,
-                    'url': video['link'],
-                    'thumbnail': video['thumbnails'][0]['url'] if video['thumbnails'] else None,
-                    'channel': video['channel']['name'],
-                    'views': video['viewCount']['text'] if video['viewCount'] else 'Unknown'
+                    'url': f"https://www.youtube.com/watch?v={video['id']}",
+                    'thumbnail': thumbnails[0]['url'] if thumbnails else None,
+                    'channel': video.get('channel') or video.get('uploader') or 'Unknown',
+                    'views': f"{view_count:,} views" if view_count else 'Unknown'
                 })
                 
             return videos
@@ -81,14 +205,37 @@ class YouTubeDownloader:
             logger.error(f"Error searching YouTube: {e}")
             return []
             
-    async def download_audio(self, url: str) -> Optional[Dict]:
-        """Download audio from YouTube URL"""
+    async def download_audio(self, url: str, prefer_native_codec: bool = True) -> Optional[Dict]:
+        """Download audio from YouTube URL, keeping YouTube's own opus/m4a stream unless mp3 is required"""
+        # A video downloaded before needs neither metadata nor a download
+        match = _VIDEO_ID_RE.search(url)
+        cached = self._video_cache.get(match.group(1)) if match else None
+        if cached is not None and (prefer_native_codec or cached['file_path'].endswith('.mp3')):
+            if os.path.exists(cached['file_path']):
+                os.utime(cached['file_path'])  # Mark as recently used for trimming
+                self._video_cache.move_to_end(cached['id'])
+                return dict(cached, url=url)  # Callers annotate the dict they get
+            del self._video_cache[cached['id']]
+            
+        # Different queries resolving to the same video share one download
+        key = (match.group(1) if match else url, prefer_native_codec)
+        task = self._downloads.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._download_audio(url, prefer_native_codec))
+            self._downloads[key] = task
+            task.add_done_callback(lambda _: self._downloads.pop(key, None))
+            
+        # Shielded so one caller giving up doesn't cancel it for the others
+        track_info = await asyncio.shield(task)
+        return dict(track_info, url=url) if track_info else track_info
+        
+    async def _download_audio(self, url: str, prefer_native_codec: bool) -> Optional[Dict]:
+        """Fetch metadata and download a video's audio unless it's already on disk"""
         try:
             loop = asyncio.get_event_loop()
             
-            # Extract info first
-            with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-                info = await loop.run_in_executor(None, ydl.extract_info, url, False)
+            # Extract info first; the download reuses it instead of extracting again
+            info = await loop.run_in_executor(None, self._extract_download_info, url)
                 
             if not info:
                 return None
@@ -98,42 +245,27 @@ class YouTubeDownloader:
             if duration_seconds > Config.MAX_SONG_DURATION:
                 raise Exception(f"Song too long! Maximum duration is {Config.MAX_SONG_DURATION // 60} minutes.")
                 
-            # Download audio
-            with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                await loop.run_in_executor(None, ydl.download, [url])
-                
-            # Format duration
-            minutes, seconds = divmod(duration_seconds, 60)
-            hours, minutes = divmod(minutes, 60)
-            
-            if hours:
-                duration_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+            # Files are named by video ID, so a track played before is reused as is
+            file_path = self._find_download(info['id'], prefer_native_codec)
+            if file_path:
+                os.utime(file_path)  # Mark as recently used for trimming
             else:
-                duration_str = f"{minutes:02d}:{seconds:02d}"
-                
-            # Find downloaded file
-            safe_title = self._sanitize_filename(info['title'])
-            possible_extensions = ['mp3', 'webm', 'm4a', 'ogg']
-            file_path = None
-            
-            for ext in possible_extensions:
-                potential_path = os.path.join(Config.DOWNLOADS_PATH, f"{safe_title}.{ext}")
-                if os.path.exists(potential_path):
-                    file_path = potential_path
-                    break
+                # Network-bound download and CPU-bound encode are capped separately
+                async with self._download_slots:
+                    src_path = await loop.run_in_executor(None, self._download, info)
+                if not src_path:
+                    raise Exception("Downloaded file not found")
                     
-            if not file_path:
-                # Try with original filename
-                for ext in possible_extensions:
-                    potential_path = os.path.join(Config.DOWNLOADS_PATH, f"{info['title']}.{ext}")
-                    if os.path.exists(potential_path):
-                        file_path = potential_path
-                        break
-                        
-            if not file_path:
-                raise Exception("Downloaded file not found")
+                file_path = src_path
+                if not (prefer_native_codec and src_path.endswith(NATIVE_AUDIO_EXTS)):
+                    file_path = self._download_path(info['id'])
+                    if src_path != file_path:
+                        await self._encode_mp3(src_path, file_path)
                 
-            return {
+            # Format duration
+            duration_str = _format_duration(duration_seconds)
+                
+            track_info = {
                 'id': info['id'],
                 'title': info['title'],
                 'duration': duration_str,
@@ -145,12 +277,60 @@ class YouTubeDownloader:
                 'views': info.get('view_count', 0)
             }
             
+            # Disk space is bounded by trim_downloads, so eviction only forgets the metadata
+            self._video_cache[info['id']] = dict(track_info)
+            self._video_cache.move_to_end(info['id'])
+            if len(self._video_cache) > VIDEO_CACHE_SIZE:
+                self._video_cache.popitem(last=False)
+            return track_info
+            
         except Exception as e:
             logger.error(f"Error downloading audio: {e}")
             raise
             
     async def search_and_download(self, query: str) -> Optional[Dict]:
-        """Search and download music"""
+        """Search and download music, reusing recent results for the same query"""
+        key = self._track_key(query)
+        cached = self._track_cache.get(key)
+        if cached is not None:
+            expiry, track_info = cached
+            # The file may have been removed by cleanup_old_files
+            if expiry > time.monotonic() and os.path.exists(track_info['file_path']):
+                os.utime(track_info['file_path'])  # Mark as recently used for trimming
+                self._track_cache.move_to_end(key)
+                return dict(track_info)  # Callers annotate the dict they get
+            del self._track_cache[key]
+            
+        # Concurrent requests for the same query share one search/download
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._resolve_track(key, query))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            
+        # Shielded so one caller giving up doesn't cancel it for the others
+        track_info = await asyncio.shield(task)
+        return dict(track_info) if track_info else track_info
+        
+    def _track_key(self, query: str) -> Tuple[str, str]:
+        """Cache key for a query: searches ignore case, URLs don't (video IDs are case-sensitive)"""
+        query = query.strip()
+        if query.startswith(('http://', 'https://')):
+            match = _VIDEO_ID_RE.search(query)
+            return ('video', match.group(1)) if match else ('url', query)
+        return ('search', query.lower())
+        
+    async def _resolve_track(self, key: Tuple[str, str], query: str) -> Optional[Dict]:
+        """Search and download a query, caching the result"""
+        track_info = await self._search_and_download(query)
+        if track_info:
+            self._track_cache[key] = (time.monotonic() + TRACK_CACHE_TTL, track_info)
+            if len(self._track_cache) > TRACK_CACHE_SIZE:
+                self._track_cache.popitem(last=False)
+        return track_info
+        
+    async def _search_and_download(self, query: str) -> Optional[Dict]:
+        """Search YouTube and download the best match"""
         try:
             # Check if query is a URL
             if query.startswith(('http://', 'https://')):
@@ -173,71 +353,130 @@ class YouTubeDownloader:
             raise
             
     async def get_lyrics(self, song_title: str) -> Optional[str]:
-        """Get lyrics for a song"""
+        """Get lyrics for a song, already cut to fit in a message"""
         if not Config.ENABLE_LYRICS:
             return None
             
+        key = song_title.strip().lower()
+        entry = self._lyrics_cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            future = entry[1]
+            self._lyrics_cache.move_to_end(key)
+        else:
+            # Concurrent requests for the same song share one lookup
+            future = asyncio.ensure_future(self._fetch_lyrics(song_title))
+            self._lyrics_cache[key] = (time.monotonic() + LYRICS_CACHE_TTL, future)
+            self._lyrics_cache.move_to_end(key)
+            if len(self._lyrics_cache) > LYRICS_CACHE_SIZE:
+                self._lyrics_cache.popitem(last=False)
+                
         try:
+            return await asyncio.shield(future)
+        except Exception as e:
+            logger.error(f"Error getting lyrics: {e}")
+            # Don't cache failures
+            entry = self._lyrics_cache.get(key)
+            if entry is not None and entry[1] is future:
+                del self._lyrics_cache[key]
+            return None
+            
+    def _get_genius(self):
+        """Get the shared Genius client, creating it on first use"""
+        if self._genius is None:
             import lyricsgenius
+            # One client means one requests session, so lookups reuse its connections
             genius = lyricsgenius.Genius(os.getenv("GENIUS_API_TOKEN", ""))
             genius.verbose = False
             genius.remove_section_headers = True
-            
-            loop = asyncio.get_event_loop()
-            song = await loop.run_in_executor(None, genius.search_song, song_title)
-            
-            if song:
-                return song.lyrics
+            self._genius = genius
+        return self._genius
+        
+    async def _fetch_lyrics(self, song_title: str) -> Optional[str]:
+        """Look up lyrics on Genius"""
+        genius = self._get_genius()
+        
+        loop = asyncio.get_event_loop()
+        song = await loop.run_in_executor(None, genius.search_song, song_title)
+        
+        if not song:
             return None
             
-        except Exception as e:
-            logger.error(f"Error getting lyrics: {e}")
-            return None
+        # Cut once here so the cache holds what is actually sent
+        lyrics = song.lyrics
+        truncated = _truncate_utf16(lyrics, LYRICS_MAX_LENGTH)
+        if truncated is not None:
+            lyrics = truncated + "...\n\n[Lyrics truncated]"
+        return lyrics
             
-    def _sanitize_filename(self, filename: str) -> str:
-        """Sanitize filename for safe storage"""
-        import re
-        # Remove or replace invalid characters
-        filename = re.sub(r'[<>:"/\\|?*]', '', filename)
-        filename = re.sub(r'\s+', ' ', filename).strip()
-        return filename[:100]  # Limit length
+    def _download_path(self, video_id: str) -> str:
+        """Where the converted audio for a video is stored"""
+        return os.path.join(Config.DOWNLOADS_PATH, f"{video_id}.mp3")
+        
+    def _find_download(self, video_id: str, prefer_native_codec: bool) -> Optional[str]:
+        """Path of an already downloaded file for the video, if there is a usable one"""
+        exts = NATIVE_AUDIO_EXTS + ('mp3',) if prefer_native_codec else ('mp3',)
+        for ext in exts:
+            path = os.path.join(Config.DOWNLOADS_PATH, f"{video_id}.{ext}")
+            if os.path.exists(path):
+                return path
+        return None
         
+    async def trim_downloads(self):
+        """Keep the downloads folder within MAX_DOWNLOADS_SIZE_MB"""
+        await asyncio.to_thread(self._trim_downloads, Config.MAX_DOWNLOADS_SIZE_MB * 1024 * 1024)
+        
+    def _trim_downloads(self, max_bytes: int):
+        """Delete least recently used downloads until the folder fits in max_bytes"""
+        files = []
+        total = 0
+        with os.scandir(Config.DOWNLOADS_PATH) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+                    
+        files.sort()
+        for _, size, path in files:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                logger.info(f"Trimmed download: {os.path.basename(path)}")
+            except FileNotFoundError:
+                total -= size
+                
     async def cleanup_old_files(self, max_age_hours: int = 24):
         """Clean up old downloaded files"""
         try:
-            import time
-            current_time = time.time()
-            
-            for filename in os.listdir(Config.DOWNLOADS_PATH):
-                file_path = os.path.join(Config.DOWNLOADS_PATH, filename)
-                if os.path.isfile(file_path):
-                    file_age = current_time - os.path.getmtime(file_path)
-                    if file_age > (max_age_hours * 3600):
-                        os.remove(file_path)
-                        logger.info(f"Cleaned up old file: {filename}")
-                        
+            await asyncio.to_thread(self._cleanup_old_files, time.time() - max_age_hours * 3600)
         except Exception as e:
             logger.error(f"Error cleaning up files: {e}")
             
+    def _cleanup_old_files(self, cutoff: float):
+        """Delete downloads last used before cutoff (runs in a worker thread)"""
+        with os.scandir(Config.DOWNLOADS_PATH) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                    try:
+                        os.remove(entry.path)
+                        logger.info(f"Cleaned up old file: {entry.name}")
+                    except FileNotFoundError:
+                        pass
+            
     async def get_video_info(self, url: str) -> Optional[Dict]:
         """Get video information without downloading"""
         try:
             loop = asyncio.get_event_loop()
             
-            with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-                info = await loop.run_in_executor(None, ydl.extract_info, url, False)
+            info = await loop.run_in_executor(None, self._extract_info, url)
                 
             if not info:
                 return None
                 
             duration_seconds = info.get('duration', 0)
-            minutes, seconds = divmod(duration_seconds, 60)
-            hours, minutes = divmod(minutes, 60)
-            
-            if hours:
-                duration_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-            else:
-                duration_str = f"{minutes:02d}:{seconds:02d}"
+            duration_str = _format_duration(duration_seconds)
                 
             return {
                 'id': info['id'],